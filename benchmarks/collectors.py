@@ -0,0 +1,260 @@
+"""
+Benchmark of the collectors against a local stand-in for the Colander API.
+
+Runs FolderCollector, ArtifactCollector and ExperimentCollector on synthetic datasets (many small
+files, a few large PCAPs, a full experiment and large traces) and reports the throughput, the number
+of requests received by the server and the peak RSS of each run. Every scenario runs in its own
+process so that the peak RSS is not shared between scenarios. Run it from the root of the repository:
+
+    python -m benchmarks.collectors --latency 0.05 --bandwidth 10M --pcap_size 2G --out results.json
+
+Save the results of several versions with --out to compare them. Use --compress to upload the
+traces, SSL key logs and PCAPs compressed, except the ones of the experiment scenario, and compare
+the results on a limited bandwidth:
+
+    python -m benchmarks.collectors -s traces --bandwidth 2M
+    python -m benchmarks.collectors -s traces --bandwidth 2M --compress
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from benchmarks.mock_colander import MockColanderServer
+
+SCENARIOS = ('small_files', 'large_pcaps', 'experiment', 'traces')
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+CASE_ID = 'case-1'
+BLOCK_SIZE = 1024 * 1024
+PCAP_HEADER = bytes.fromhex('d4c3b2a1020004000000000000000000ffff000001000000')
+
+
+def parse_size(size: str) -> int:
+    size = size.strip().upper().removesuffix('B').removesuffix('I')
+    unit = size[-1] if size and size[-1] in SIZE_UNITS else ''
+    return int(float(size.removesuffix(unit)) * SIZE_UNITS[unit])
+
+
+def write_file(path: Path, size: int, block: bytes, header: bytes = b''):
+    # The header makes every file unique so that none of them is skipped as already uploaded
+    header = header + path.name.encode()
+    with path.open('wb') as out:
+        out.write(header)
+        remaining = size - len(header)
+        while remaining > 0:
+            out.write(block[:remaining])
+            remaining -= len(block)
+
+
+def generate_small_files(path: Path, count: int, size: int, block: bytes):
+    path.mkdir(parents=True)
+    for i in range(count):
+        file_path = path / f'file_{i:05d}.bin'
+        write_file(file_path, size, block)
+        # Avoid the interactive prompt for the artifact type
+        (path / f'{file_path.name}.metadata.json').write_text('{"mimetype": "image/png"}')
+
+
+def generate_large_pcaps(path: Path, count: int, size: int, block: bytes):
+    path.mkdir(parents=True)
+    for i in range(count):
+        write_file(path / f'capture_{i}.pcap', size, block, header=PCAP_HEADER)
+
+
+def generate_experiment(path: Path, pcap_size: int, block: bytes):
+    path.mkdir(parents=True)
+    write_file(path / 'traffic.pcap', pcap_size, block, header=PCAP_HEADER)
+    traces = [{'pid': 1234, 'process': 'com.example', 'data': block[:256].hex(), 'timestamp': i} for i in range(20000)]
+    (path / 'socket_trace.json').write_text(json.dumps(traces))
+    (path / 'aes_info.json').write_text(json.dumps(traces[:2000]))
+    (path / 'sslkeylog.txt').write_text(''.join(f'CLIENT_RANDOM {i:064x} {i:096x}\n' for i in range(1000)))
+    write_file(path / 'screen.mp4', 50 * BLOCK_SIZE, block)
+    (path / 'device.json').write_text(json.dumps({'brand': 'Google', 'model': 'Pixel 6', 'imei': '000000000000000'}))
+    (path / 'experiment.json').write_text(json.dumps({
+        'network': {'file': 'traffic.pcap'},
+        'socket_traces': {'file': 'socket_trace.json'},
+        'crypto_traces': {'file': 'aes_info.json'},
+        'sslkeylog': {'file': 'sslkeylog.txt'},
+        'screen': {'file': 'screen.mp4'},
+        'device': {'file': 'device.json'},
+    }))
+
+
+def generate_traces(path: Path, size: int):
+    # Records shaped like the ones of pirogue-intercept, the payloads are random so that they do
+    # not compress better than real ones
+    path.mkdir(parents=True)
+    with (path / 'socket_trace.json').open('w') as out:
+        out.write('[')
+        written, i = 0, 0
+        while written < size:
+            record = json.dumps({
+                'socket_event_type': 'write', 'socket_type': 'tcp', 'dst_addr': f'10.0.{i % 7}.{i % 251}',
+                'dst_port': 443, 'local_port': 40000 + i % 1000, 'pid': 4242, 'process': 'com.example.app',
+                'timestamp': 1700000000 + i, 'data': os.urandom(96).hex(),
+            })
+            written += out.write((',' if i else '') + record)
+            i += 1
+        out.write(']')
+    crypto = [{'alg': 'AES/CBC/PKCS5Padding', 'key': os.urandom(16).hex(), 'iv': os.urandom(16).hex(), 'pid': 4242,
+               'timestamp': 1700000000 + i, 'input': os.urandom(64).hex(), 'output': os.urandom(64).hex()}
+              for i in range(max(1, size // 4 // 400))]
+    (path / 'aes_info.json').write_text(json.dumps(crypto))
+    (path / 'sslkeylog.txt').write_text(''.join(
+        f'CLIENT_RANDOM {os.urandom(32).hex()} {os.urandom(48).hex()}\n' for _ in range(max(1, size // 16 // 176))))
+
+
+def generate_datasets(data_dir: Path, args) -> dict[str, Path]:
+    datasets = {name: data_dir / name for name in SCENARIOS}
+    block = os.urandom(BLOCK_SIZE)
+    # Datasets are reused when the same data folder is given again
+    if not datasets['small_files'].exists():
+        print(f'Generating {args.small_count} small files')
+        generate_small_files(datasets['small_files'], args.small_count, args.small_size, block)
+    if not datasets['large_pcaps'].exists():
+        print(f'Generating {args.pcap_count} PCAPs of {args.pcap_size} bytes')
+        generate_large_pcaps(datasets['large_pcaps'], args.pcap_count, args.pcap_size, block)
+    if not datasets['experiment'].exists():
+        print('Generating an experiment')
+        generate_experiment(datasets['experiment'], args.pcap_size, block)
+    if not datasets['traces'].exists():
+        print(f'Generating {args.traces_size} bytes of traces')
+        generate_traces(datasets['traces'], args.traces_size)
+    return datasets
+
+
+def run_worker(scenario: str, data_path: Path, base_url: str, jobs: int, compress: bool, result_path: str):
+    # Imported here since the configuration folder depends on the HOME set by the parent process
+    from pirogue_colander_connector.collectors.artifact import ArtifactCollector
+    from pirogue_colander_connector.collectors.experiment import ExperimentCollector
+    from pirogue_colander_connector.collectors.folder import FolderCollector
+    from pirogue_colander_connector.collectors.metrics import metrics
+    from pirogue_colander_connector.collectors.scheduler import UploadScheduler
+    from pirogue_colander_connector.commands.configure import Configuration
+
+    Configuration().write_configuration_file(base_url, 'benchmark')
+    metrics.reset()
+    start = time.monotonic()
+    if scenario == 'experiment':
+        ExperimentCollector(data_path, CASE_ID, 'Benchmark', jobs=jobs).collect()
+    elif scenario == 'large_pcaps':
+        # One file at a time, as collect-artifact does for a single file
+        with UploadScheduler(max_workers=1) as scheduler:
+            for pcap in sorted(data_path.glob('*.pcap')):
+                ArtifactCollector(pcap, CASE_ID, artifact_type_name='PCAP', scheduler=scheduler,
+                                  compress=compress).collect()
+    else:
+        _, failed = FolderCollector(data_path, CASE_ID, jobs=jobs, compress=compress).collect()
+        if failed:
+            raise Exception(f'{len(failed)} file(s) failed to upload')
+    elapsed = time.monotonic() - start
+    report = metrics.report()
+    report.pop('uploads')
+    report['elapsed'] = elapsed
+    # Kilobytes on Linux
+    report['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    with open(result_path, mode='w') as out:
+        json.dump(report, out)
+
+
+def run_scenario(scenario: str, data_path: Path, server: MockColanderServer, jobs: int, compress: bool) -> dict:
+    server.state.reset_counters()
+    size = sum(f.stat().st_size for f in data_path.iterdir() if not f.name.endswith('.metadata.json'))
+    with tempfile.TemporaryDirectory() as home:
+        result_path = f'{home}/result.json'
+        env = dict(os.environ, HOME=home)
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.collectors', '--worker', scenario, '--data_dir', str(data_path),
+             '--base_url', server.base_url, '--jobs', str(jobs), '--result', result_path]
+            + (['--compress'] if compress else []),
+            env=env, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        with open(result_path) as f:
+            report = json.load(f)
+    return {
+        'scenario': scenario,
+        'dataset_bytes': size,
+        'bytes_sent': report['bytes_sent'],
+        'elapsed': round(report['elapsed'], 3),
+        'throughput': round(size / report['elapsed'], 2),
+        'transfer_throughput': report['transfer_throughput'],
+        'peak_rss': report['peak_rss'],
+        'requests': dict(server.state.requests),
+        'api_calls': {k: v['count'] for k, v in report['api_calls'].items()},
+        'phases': {k: round(v['seconds'], 3) for k, v in report['phases'].items()},
+        'counters': report['counters'],
+    }
+
+
+def get_version() -> str:
+    try:
+        return version('pirogue-colander-connector')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+def print_result(result: dict):
+    mib = 1024 * 1024
+    print(f'{result["scenario"]:>12}: {result["dataset_bytes"] / mib:10.1f} MiB in {result["elapsed"]:8.2f} s, '
+          f'{result["throughput"] / mib:7.2f} MiB/s, {result["bytes_sent"] / mib:10.1f} MiB sent, '
+          f'{sum(result["requests"].values()):6d} requests, '
+          f'peak RSS {result["peak_rss"] / mib:6.1f} MiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collectors against a local mock Colander server')
+    parser.add_argument('-s', '--scenario', choices=SCENARIOS, action='append',
+                        help='Specify the scenario to run, all of them by default')
+    parser.add_argument('--data_dir', help='Specify where the datasets are generated and kept between runs')
+    parser.add_argument('--latency', type=float, default=0.0, help='Specify the latency of the server in seconds')
+    parser.add_argument('--bandwidth', type=parse_size, default=0,
+                        help='Specify the bandwidth of the server in bytes per second, such as 10M (unlimited by default)')
+    parser.add_argument('-j', '--jobs', type=int, default=4)
+    parser.add_argument('--small_count', type=int, default=2000)
+    parser.add_argument('--small_size', type=parse_size, default=parse_size('16K'))
+    parser.add_argument('--pcap_count', type=int, default=3)
+    parser.add_argument('--pcap_size', type=parse_size, default=parse_size('2G'))
+    parser.add_argument('--traces_size', type=parse_size, default=parse_size('128M'))
+    parser.add_argument('-z', '--compress', action='store_true',
+                        help='Compress the traces, SSL key logs and PCAPs while uploading them')
+    parser.add_argument('--out', help='Specify the path of the JSON results')
+    parser.add_argument('--worker', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--base_url', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, Path(args.data_dir), args.base_url, args.jobs, args.compress, args.result)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        datasets = generate_datasets(Path(args.data_dir or tmp), args)
+        results = []
+        with MockColanderServer(latency=args.latency, bandwidth=args.bandwidth) as server:
+            for scenario in args.scenario or SCENARIOS:
+                result = run_scenario(scenario, datasets[scenario], server, args.jobs, args.compress)
+                print_result(result)
+                results.append(result)
+    if args.out:
+        with open(args.out, mode='w') as out:
+            json.dump({
+                'version': get_version(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'latency': args.latency,
+                'bandwidth': args.bandwidth,
+                'jobs': args.jobs,
+                'compress': args.compress,
+                'results': results,
+            }, out, indent=2)
+        print(f'Results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
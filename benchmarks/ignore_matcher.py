@@ -0,0 +1,83 @@
+"""
+Micro-benchmark of ColanderIgnoreFile.is_ignored.
+
+Compares the compiled matcher with the previous implementation, which called fnmatch twice per
+pattern and per path. Run it from the root of the repository:
+
+    python -m benchmarks.ignore_matcher --paths 10000 --patterns 100
+"""
+import argparse
+import random
+import tempfile
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+
+from pirogue_colander_connector.collectors.ignore import ColanderIgnoreFile
+
+EXTENSIONS = ['pcap', 'pcapng', 'json', 'txt', 'mp4', 'apk', 'log', 'pem', 'md', 'tmp']
+
+
+def legacy_is_ignored(patterns, path: Path) -> bool:
+    for pattern in patterns:
+        if fnmatch(path.name, pattern):
+            return True
+        elif fnmatch(str(path), pattern):
+            return True
+    return False
+
+
+def generate_patterns(count: int, rng: random.Random) -> list[str]:
+    patterns = []
+    while len(patterns) < count:
+        kind = rng.randrange(3)
+        if kind == 0:
+            patterns.append(f'*.{rng.choice(EXTENSIONS)}{len(patterns)}')
+        elif kind == 1:
+            patterns.append(f'capture_{len(patterns)}_*')
+        else:
+            patterns.append(f'session-{len(patterns)}?.*')
+    return patterns
+
+
+def generate_paths(root: Path, count: int, rng: random.Random) -> list[Path]:
+    paths = []
+    for i in range(count):
+        depth = rng.randrange(4)
+        folders = [f'dir{rng.randrange(20)}' for _ in range(depth)]
+        paths.append(root.joinpath(*folders, f'file_{i}.{rng.choice(EXTENSIONS)}'))
+    return paths
+
+
+def measure(name: str, fn, paths: list[Path]) -> int:
+    start = time.perf_counter()
+    ignored = sum(1 for p in paths if fn(p))
+    elapsed = time.perf_counter() - start
+    print(f'{name:>10}: {elapsed * 1000:8.1f} ms, {elapsed / len(paths) * 1e6:6.2f} µs/path, {ignored} ignored')
+    return ignored
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the .colander_ignore pattern matching')
+    parser.add_argument('--paths', type=int, default=10000)
+    parser.add_argument('--patterns', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        patterns = generate_patterns(args.patterns, rng)
+        (root / ColanderIgnoreFile.ignore_file_name).write_text('\n'.join(patterns))
+        paths = generate_paths(root, args.paths, rng)
+        ignore_file = ColanderIgnoreFile(root)
+        legacy_patterns = list(ColanderIgnoreFile.default_ignore_patterns) + patterns
+        print(f'{args.paths} paths x {len(ignore_file.ignored_patterns)} patterns')
+        legacy = measure('fnmatch', lambda p: legacy_is_ignored(legacy_patterns, p), paths)
+        compiled = measure('compiled', ignore_file.is_ignored, paths)
+        if legacy != compiled:
+            print('Warning: both implementations do not ignore the same number of paths')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+Local stand-in for the Colander API used by the benchmarks.
+
+Serves the Core API schema and the endpoints colander_client uses for cases, artifact types, uploads,
+devices and experiments. The uploaded chunks are written to disk so that multi-GB files do not end
+up in memory. A latency added to every request and a bandwidth limit of the request bodies emulate
+a remote server.
+"""
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def _link(url, action='get', fields=(), encoding=''):
+    link = {'_type': 'link', 'url': url, 'action': action, 'fields': []}
+    if encoding:
+        link['encoding'] = encoding
+    for name, required, location in fields:
+        link['fields'].append({'name': name, 'required': required, 'location': location})
+    return link
+
+
+ARTIFACT_FIELDS = [
+    ('case', True, 'form'), ('type', True, 'form'), ('upload_request_ref', True, 'form'),
+    ('attributes', False, 'form'), ('name', False, 'form'), ('description', False, 'form'),
+    ('tlp', False, 'form'), ('pap', False, 'form'), ('extracted_from', False, 'form'),
+]
+
+EXPERIMENT_FIELDS = [
+    ('name', True, 'form'), ('case', True, 'form'), ('pcap', True, 'form'), ('socket_trace', True, 'form'),
+    ('sslkeylog', True, 'form'), ('screencast', False, 'form'), ('aes_trace', False, 'form'),
+    ('target_device', False, 'form'), ('target_artifact', False, 'form'), ('extra_files', False, 'form'),
+]
+
+
+def schema():
+    return {
+        '_type': 'document',
+        '_meta': {'url': '/api/schema', 'title': 'Mock Colander'},
+        'cases': {
+            'read': _link('/api/cases/{id}/', fields=[('id', True, 'path')]),
+            'list': _link('/api/cases/'),
+        },
+        'artifact_types': {'list': _link('/api/artifact_types/')},
+        'device_types': {'list': _link('/api/device_types/')},
+        'upload_requests': {
+            'create': _link('/api/upload_requests/', 'post', [
+                ('name', True, 'form'), ('size', True, 'form'), ('chunks', True, 'form')], 'application/json'),
+            'read': _link('/api/upload_requests/{id}/', fields=[('id', True, 'path')]),
+            'partial_update': _link('/api/upload_requests/{id}/', 'patch', [
+                ('id', True, 'path'), ('file', True, 'form'), ('addr', True, 'form')], 'multipart/form-data'),
+        },
+        'artifacts': {
+            'create': _link('/api/artifacts/', 'post', ARTIFACT_FIELDS, 'application/json'),
+            'list': _link('/api/artifacts/'),
+            'read': _link('/api/artifacts/{id}/', fields=[('id', True, 'path')]),
+        },
+        'devices': {
+            'list': _link('/api/devices/'),
+            'create': _link('/api/devices/', 'post', [
+                ('name', True, 'form'), ('case', True, 'form'), ('type', True, 'form'),
+                ('attributes', False, 'form')], 'application/json'),
+        },
+        'pirogue_experiments': {
+            'create': _link('/api/pirogue_experiments/', 'post', EXPERIMENT_FIELDS, 'application/json'),
+            'list': _link('/api/pirogue_experiments/'),
+        },
+    }
+
+
+ARTIFACT_TYPES = [
+    {'id': i, 'name': n.title(), 'short_name': n}
+    for i, n in enumerate(['PCAP', 'SOCKET_T', 'CRYPTO_T', 'SSLKEYLOG', 'VIDEO', 'IMAGE', 'DOCUMENT', 'SAMPLE',
+                           'OTHER'], start=1)
+]
+DEVICE_TYPES = [{'id': 1, 'name': 'Mobile', 'short_name': 'MOBILE'}]
+
+
+class MockColanderState:
+    def __init__(self, latency: float = 0.0, bandwidth: int = 0, drop_after: int = None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop_after = drop_after
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.requests = {}
+        self.upload_requests = {}
+        self.artifacts = {}
+        self.devices = {}
+        self.experiments = {}
+        self.cases = {'case-1': {'id': 'case-1', 'name': 'Mock case'}}
+        self.chunk_count = 0
+        self.storage = tempfile.TemporaryDirectory(prefix='mock-colander-')
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = {}
+
+    def count(self, key):
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+
+class MockColanderHandler(BaseHTTPRequestHandler):
+    server_version = 'MockColander/1.0'
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent separately, do not let the delayed ACKs slow down every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self) -> MockColanderState:
+        return self.server.state
+
+    def _upload_path(self, upload_request_id: str) -> str:
+        return os.path.join(self.state.storage.name, upload_request_id)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        if self.state.bandwidth:
+            time.sleep(length / self.state.bandwidth)
+        return body
+
+    def _send(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method):
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p][1:]
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self._read_body() if method in ('POST', 'PATCH') else b''
+        resource = parts[0] if parts else ''
+        self.state.count(f'{method} {resource}')
+        handler = getattr(self, f'_{method.lower()}_{resource}', None)
+        if handler is None:
+            return self._send({'detail': 'Not found'}, 404)
+        return handler(parts[1:], query, body)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PATCH(self):
+        self._route('PATCH')
+
+    def _get_schema(self, parts, query, body):
+        self.send_response(200)
+        data = json.dumps(schema()).encode()
+        self.send_header('Content-Type', 'application/coreapi+json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _get_cases(self, parts, query, body):
+        if parts:
+            case = self.state.cases.get(parts[0])
+            return self._send(case, 200) if case else self._send({'detail': 'Not found'}, 404)
+        return self._send(list(self.state.cases.values()))
+
+    def _get_artifact_types(self, parts, query, body):
+        self._send(ARTIFACT_TYPES)
+
+    def _get_device_types(self, parts, query, body):
+        self._send(DEVICE_TYPES)
+
+    def _post_upload_requests(self, parts, query, body):
+        params = json.loads(body)
+        upr = {'id': str(next(self.state.ids)), 'name': params['name'], 'size': int(params['size']),
+               'chunks': params['chunks'], 'received': {}, 'eof': False, 'status': 'PENDING'}
+        self.state.upload_requests[upr['id']] = upr
+        open(self._upload_path(upr['id']), mode='wb').close()
+        self._send(self._upload_request(upr), 201)
+
+    @staticmethod
+    def _upload_request(upr: dict) -> dict:
+        return {k: v for k, v in upr.items() if k != 'received'}
+
+    def _get_upload_requests(self, parts, query, body):
+        upr = self.state.upload_requests.get(parts[0])
+        if not upr:
+            return self._send({'detail': 'Not found'}, 404)
+        self._send(self._upload_request(upr))
+
+    def _patch_upload_requests(self, parts, query, body):
+        with self.state.lock:
+            self.state.chunk_count += 1
+            drop = self.state.drop_after is not None and self.state.chunk_count > self.state.drop_after
+        if drop:
+            self.state.drop_after = None
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        upr = self.state.upload_requests.get(parts[0])
+        if not upr:
+            return self._send({'detail': 'Not found'}, 404)
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {self.headers["Content-Type"]}\r\n\r\n'.encode() + body)
+        fields = {p.get_param('name', header='content-disposition'): p.get_payload(decode=True)
+                  for p in message.iter_parts()}
+        addr = int(fields['addr'])
+        chunk = fields['file']
+        if hashlib.sha256(chunk).hexdigest() != upr['chunks'].get(str(addr)):
+            return self._send({'detail': 'Chunk hash mismatch'}, 400)
+        with open(self._upload_path(upr['id']), mode='r+b') as f:
+            f.seek(addr)
+            f.write(chunk)
+        upr['received'][addr] = len(chunk)
+        upr['eof'] = sum(upr['received'].values()) >= upr['size']
+        upr['status'] = 'SUCCEEDED' if upr['eof'] else 'PENDING'
+        self._send(self._upload_request(upr))
+
+    def _post_artifacts(self, parts, query, body):
+        params = json.loads(body)
+        upr = self.state.upload_requests.get(params['upload_request_ref'])
+        # Colander refuses the unknown upload requests and the ones already used by an artifact
+        with self.state.lock:
+            if not upr or upr.get('used'):
+                return self._send({'upload_request_ref': ['Invalid upload request']}, 400)
+            upr['used'] = True
+        sha256 = hashlib.sha256()
+        with open(self._upload_path(upr['id']), mode='rb') as f:
+            while buf := f.read(1024 * 1024):
+                sha256.update(buf)
+        artifact = dict(params)
+        artifact.update({
+            'id': str(next(self.state.ids)), 'name': upr['name'], 'original_name': upr['name'],
+            'size_in_bytes': upr['size'], 'sha256': sha256.hexdigest(),
+        })
+        self.state.artifacts[artifact['id']] = artifact
+        self._send(artifact, 201)
+
+    def _get_artifacts(self, parts, query, body):
+        if parts:
+            return self._send(self.state.artifacts[parts[0]])
+        artifacts = [a for a in self.state.artifacts.values()
+                     if 'case_id' not in query or a['case'] == query['case_id']]
+        self._send(artifacts)
+
+    def _get_devices(self, parts, query, body):
+        devices = [d for d in self.state.devices.values()
+                   if d['case'] == query.get('case_id', d['case']) and d['name'] == query.get('name', d['name'])]
+        self._send(devices)
+
+    def _post_devices(self, parts, query, body):
+        device = json.loads(body)
+        device['id'] = str(next(self.state.ids))
+        self.state.devices[device['id']] = device
+        self._send(device, 201)
+
+    def _post_pirogue_experiments(self, parts, query, body):
+        experiment = json.loads(body)
+        experiment['id'] = str(next(self.state.ids))
+        self.state.experiments[experiment['id']] = experiment
+        self._send(experiment, 201)
+
+    def _get_pirogue_experiments(self, parts, query, body):
+        self._send(list(self.state.experiments.values()))
+
+
+class MockColanderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), **kwargs):
+        super().__init__(address, MockColanderHandler)
+        self.state = MockColanderState(**kwargs)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+        self.state.storage.cleanup()
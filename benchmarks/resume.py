@@ -0,0 +1,158 @@
+"""
+Check of the resumable uploads against a local stand-in for the Colander API dropping connections.
+
+Uploads files through ArtifactCollector while the server drops a connection in the middle of the
+transfer, and fails if the file stored by the server does not match, if an interrupted upload is not
+resumed from its checkpoint by the next run, if a checkpoint whose upload request cannot be used
+anymore is not started over, or if identical files collected in parallel are uploaded more than
+once. Run it from the root of the repository:
+
+    python -m benchmarks.resume
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.mock_colander import MockColanderServer
+
+CASE_ID = 'case-1'
+CHUNK_SIZE = 1024 * 1024
+
+
+def write_random_file(path: Path, size: int) -> str:
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def configure(server: MockColanderServer, max_retries: int):
+    from pirogue_colander_connector.commands.configure import Configuration
+    Configuration().write_configuration_file(server.base_url, 'benchmark', max_retries=max_retries)
+
+
+def collect(path: Path, scheduler=None) -> dict:
+    from pirogue_colander_connector.collectors.artifact import ArtifactCollector
+    return ArtifactCollector(path, CASE_ID, artifact_type_name='OTHER', scheduler=scheduler).collect()
+
+
+def check_retry(data_dir: Path, chunks: int) -> list[str]:
+    # The dropped chunk is sent again by the client, within the same run
+    errors = []
+    path = data_dir / 'retry.bin'
+    sha256 = write_random_file(path, chunks * CHUNK_SIZE + 1234)
+    with MockColanderServer(drop_after=chunks // 2) as server:
+        configure(server, max_retries=3)
+        artifact = collect(path)
+        if artifact['sha256'] != sha256:
+            errors.append(f'stored file {artifact["sha256"]} instead of {sha256}')
+        if len(server.state.upload_requests) != 1:
+            errors.append(f'{len(server.state.upload_requests)} upload requests instead of 1')
+    return errors
+
+
+def check_resume(data_dir: Path, chunks: int) -> list[str]:
+    # Without retries the drop interrupts the run, the next one continues from the checkpoint
+    from pirogue_colander_connector.commands.configure import Configuration
+    errors = []
+    path = data_dir / 'resume.bin'
+    sha256 = write_random_file(path, chunks * CHUNK_SIZE + 1234)
+    sent_before_drop = chunks // 2
+    with MockColanderServer(drop_after=sent_before_drop) as server:
+        configure(server, max_retries=0)
+        try:
+            collect(path)
+            errors.append('the first run has not been interrupted')
+        except Exception:
+            pass
+        checkpoint = Configuration().get_artifact_index().get_checkpoint(sha256, path.stat().st_size)
+        if not checkpoint or checkpoint[1] != sent_before_drop * CHUNK_SIZE:
+            errors.append(f'checkpoint {checkpoint} instead of {sent_before_drop * CHUNK_SIZE} bytes')
+        server.state.reset_counters()
+        artifact = collect(path)
+        if artifact['sha256'] != sha256:
+            errors.append(f'stored file {artifact["sha256"]} instead of {sha256}')
+        if len(server.state.upload_requests) != 1:
+            errors.append(f'{len(server.state.upload_requests)} upload requests instead of 1')
+        # One more chunk for the last partial one
+        expected = chunks + 1 - sent_before_drop
+        sent = server.state.requests.get('PATCH upload_requests', 0)
+        if sent != expected:
+            errors.append(f'{sent} chunks sent by the second run instead of {expected}')
+    return errors
+
+
+def check_stale_checkpoint(data_dir: Path, chunks: int) -> list[str]:
+    # A checkpoint of a complete upload whose upload request cannot be used anymore is started over
+    from pirogue_colander_connector.commands.configure import Configuration
+    errors = []
+    path = data_dir / 'stale.bin'
+    sha256 = write_random_file(path, chunks * CHUNK_SIZE)
+    size = path.stat().st_size
+    with MockColanderServer() as server:
+        configure(server, max_retries=0)
+        index = Configuration().get_artifact_index()
+        index.save_checkpoint(sha256, size, 'expired', size)
+        artifact = collect(path)
+        if artifact['sha256'] != sha256:
+            errors.append(f'stored file {artifact["sha256"]} instead of {sha256}')
+        if index.get_checkpoint(sha256, size):
+            errors.append('the stale checkpoint has been kept')
+    return errors
+
+
+def check_duplicates(data_dir: Path, chunks: int) -> list[str]:
+    # Identical files collected in parallel are uploaded once, the others reuse the artifact
+    from concurrent.futures import wait
+    from pirogue_colander_connector.collectors.scheduler import UploadScheduler
+    errors = []
+    data = os.urandom(chunks * CHUNK_SIZE)
+    paths = [data_dir / f'duplicate_{i}.bin' for i in range(3)]
+    for path in paths:
+        path.write_bytes(data)
+    with MockColanderServer(drop_after=chunks) as server:
+        configure(server, max_retries=3)
+        with UploadScheduler(max_workers=len(paths)) as scheduler:
+            futures = [scheduler.submit(collect, path, scheduler) for path in paths]
+            wait(futures)
+        artifacts = {f.result()['id'] for f in futures}
+        if len(server.state.upload_requests) != 1 or len(artifacts) != 1:
+            errors.append(f'{len(server.state.upload_requests)} upload requests and {len(artifacts)} artifacts '
+                          f'instead of 1')
+    return errors
+
+
+CHECKS = {
+    'retry': check_retry,
+    'resume': check_resume,
+    'stale': check_stale_checkpoint,
+    'duplicates': check_duplicates,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the resumable uploads against a mock Colander server')
+    parser.add_argument('--chunks', type=int, default=8, help='Specify the size of the uploaded files in chunks')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as home:
+        # The configuration, the index and the checkpoints are kept in a temporary HOME
+        os.environ['HOME'] = home
+        data_dir = Path(home)
+        for name, check in CHECKS.items():
+            try:
+                errors = check(data_dir, args.chunks)
+            except Exception as e:
+                errors = [f'{type(e).__name__}: {e}']
+            print(f'{name:>12}: {"failed" if errors else "ok"}')
+            for error in errors:
+                print(f'{"":>12}  {error}')
+            failed = failed or bool(errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
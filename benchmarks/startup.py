@@ -0,0 +1,79 @@
+"""
+Import time regression check of the pirogue-colander command line.
+
+Runs the commands which do not talk to Colander with `python -X importtime` and fails if any of
+them imports the Colander client, the HTTP stack or the progress display, or if their imports take
+longer than --max_ms. Run it from the root of the repository:
+
+    python -m benchmarks.startup --max_ms 100
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+COMMANDS = {
+    'help': ['--help'],
+    'config': ['config', '-u', 'http://127.0.0.1:8000', '-k', 'benchmark'],
+    'clear-cache': ['clear-cache'],
+}
+FORBIDDEN_MODULES = ('colander_client', 'coreapi', 'requests', 'urllib3', 'sqlite3', 'rich.progress', 'rich.prompt')
+RUN_MAIN = 'import sys; from pirogue_colander_connector.commands.entrypoint import main; sys.argv[0] = "pirogue-colander"; main()'
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, int]]:
+    # Lines look like "import time:   self [us] |  cumulative | imported package", the depth of the
+    # import being given by the indentation of the package name
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+    return imports
+
+
+def measure(args: list[str]) -> tuple[list[str], int]:
+    with tempfile.TemporaryDirectory() as home:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', RUN_MAIN, *args],
+            env=dict(os.environ, HOME=home), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, text=True, check=True)
+    imports = parse_importtime(result.stderr)
+    # Skip the modules imported by the interpreter before the command starts
+    first = next(i for i, (name, _, _) in enumerate(imports) if name.startswith('pirogue_colander_connector'))
+    imports = imports[first:]
+    modules = [name for name, _, _ in imports]
+    total = sum(cumulative for _, depth, cumulative in imports if depth == 0)
+    return modules, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of the pirogue-colander commands')
+    parser.add_argument('--max_ms', type=float, default=0,
+                        help='Specify the maximum import time of each command in milliseconds (not checked by default)')
+    parser.add_argument('--runs', type=int, default=5, help='Specify how many times each command is run')
+    args = parser.parse_args()
+
+    failed = False
+    for command, command_args in COMMANDS.items():
+        timings = []
+        for _ in range(args.runs):
+            modules, total = measure(command_args)
+            timings.append(total)
+        best = min(timings) / 1000
+        forbidden = [f for f in FORBIDDEN_MODULES if any(m == f or m.startswith(f'{f}.') for m in modules)]
+        print(f'{command:>12}: {best:7.1f} ms, {len(modules)} modules imported')
+        if forbidden:
+            print(f'{"":>12}  imports {", ".join(forbidden)}')
+            failed = True
+        if args.max_ms and best > args.max_ms:
+            print(f'{"":>12}  exceeds {args.max_ms} ms')
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
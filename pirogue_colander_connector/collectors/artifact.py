@@ -1,11 +1,21 @@
 import json
 import logging
-from functools import partial
+import os
+import sys
+import time
 from pathlib import Path
 
-from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, TaskID, TextColumn, BarColumn, TimeRemainingColumn
 from rich.prompt import IntPrompt
 
+from pirogue_colander_connector.collectors.compression import COMPRESSED_TYPES, available_algorithm, hash_compressed_file
+from pirogue_colander_connector.collectors.events import ARTIFACT, events
+from pirogue_colander_connector.collectors.index import ArtifactIndex, hash_file
+from pirogue_colander_connector.collectors.lookup import ColanderLookup
+from pirogue_colander_connector.collectors.metrics import metrics
+from pirogue_colander_connector.collectors.pcap import summarize_pcap
+from pirogue_colander_connector.collectors.scheduler import UploadScheduler, artifact_priority
+from pirogue_colander_connector.collectors.sniffer import sniff_artifact_type
+from pirogue_colander_connector.collectors.upload import ResumableUpload
 from pirogue_colander_connector.commands.configure import Configuration
 
 log = logging.getLogger(__name__)
@@ -18,61 +28,117 @@ MIMETYPE_MAPPING = {
 }
 
 class ArtifactCollector:
+    fallback_type_name = 'OTHER'
+    # Files which do not shrink by at least 10% are sent as they are
+    max_compression_ratio = 0.9
+
     def __init__(self, artifact_path: Path, case_id: str, artifact_type_name: str = None,
-                 attributes=None):
-        configuration = Configuration()
-        if not configuration.is_valid:
-            msg = f'You Colander configuration is invalid'
-            log.error(msg)
-            return
-        self.colander_client = configuration.get_colander_client()
+                 attributes=None, lookup: ColanderLookup = None, index: ArtifactIndex = None,
+                 force: bool = False, scheduler: UploadScheduler = None, interactive: bool = None,
+                 pcap_summary: bool = False, compress: bool = False, stat: os.stat_result = None):
+        if not lookup or not index:
+            configuration = Configuration()
+            if not configuration.is_valid:
+                msg = f'You Colander configuration is invalid'
+                log.error(msg)
+                return
+            lookup = lookup or configuration.get_colander_lookup()
+            index = index or configuration.get_artifact_index()
+        self.lookup = lookup
+        self.index = index
+        self.force = force
+        self.scheduler = scheduler
+        self.pcap_summary = pcap_summary
+        self.compress = compress
+        self.colander_client = lookup.colander_client
         self.artifact_path = artifact_path
+        # Stat of the file already known by the caller, such as the folder walker, not done again
+        self.stat = stat
         self.case_id = case_id
         self.attributes = attributes or {}
         self.artifact_type = None
+        # Nobody can answer the prompt of unattended uploads
+        self.interactive = sys.stdin.isatty() if interactive is None else interactive
         self._load_extra_attributes()
 
         if not artifact_type_name:
             guessed_type = self._guess_artifact_type()
-            artifact_type_name = guessed_type if guessed_type else self.ask_type()
-            self.artifact_type = self.colander_client.get_artifact_type_by_short_name(artifact_type_name)
+            if guessed_type:
+                # Colander may not know the guessed type, such as SAMPLE on older servers
+                self.artifact_type = self.lookup.find_artifact_type_by_short_name(guessed_type)
+                if not self.artifact_type:
+                    log.warning(f'The type {guessed_type} guessed for {self.artifact_path} does not exist in Colander')
+            if not self.artifact_type:
+                artifact_type_name = self.ask_type() if self.interactive else self.fallback_type_name
+                self.artifact_type = self.lookup.get_artifact_type_by_short_name(artifact_type_name)
             if not self.artifact_type:
                 log.error('Unable to determine the type of the artifact.')
                 return
         else:
-            self.artifact_type = self.colander_client.get_artifact_type_by_short_name(artifact_type_name)
-
-        self.progress = Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            TimeRemainingColumn(),
-            TimeElapsedColumn(),
-        )
-        self.progress.start()
-        if not self.artifact_path.exists() or not self.artifact_path.is_file():
+            self.artifact_type = self.lookup.get_artifact_type_by_short_name(artifact_type_name)
+
+        if not self.stat and not self.artifact_path.is_file():
             msg = f'{self.artifact_path} is not a file'
             log.error(msg)
             raise Exception(msg)
 
+    @property
+    def priority(self) -> tuple[int, int]:
+        stat = self.stat or self.artifact_path.stat()
+        return artifact_priority(self.artifact_type.get('short_name'), stat.st_size)
+
     def _load_extra_attributes(self):
         # Load extra attributes from the metadata file if it exists
         metadata_file_path = self.artifact_path.parent / (self.artifact_path.name + '.metadata.json')
-        if metadata_file_path.exists() and metadata_file_path.is_file():
+        try:
             with metadata_file_path.open('r') as f:
                 metadata = json.load(f)
-            self.attributes.update(metadata)
+        except (FileNotFoundError, IsADirectoryError):
+            return
+        self.attributes.update(metadata)
 
     def _guess_artifact_type(self) -> str:
         mimetype = self.attributes.get('mimetype', '')
         for mt, t in MIMETYPE_MAPPING.items():
             if mimetype.startswith(mt):
                 return t
+        # Only the first bytes of the file are read, without any call to Colander
+        if self.stat or self.artifact_path.is_file():
+            return sniff_artifact_type(self.artifact_path)
         return ''
 
+    def _summarize_pcap(self):
+        # A capture which cannot be parsed is still uploaded, only without its summary
+        try:
+            with metrics.phase('pcap_summary'):
+                self.attributes.update(summarize_pcap(self.artifact_path))
+        except Exception as e:
+            log.warning(f'Unable to summarize {self.artifact_path}: {e}')
+
+    def _compress(self, digest: tuple[str, int, dict[int, str]]):
+        # First pass over the compressed content, its digest is needed to initiate the upload
+        if not self.compress or self.artifact_type.get('short_name') not in COMPRESSED_TYPES:
+            return None, digest
+        sha256, size, _ = digest
+        algorithm = available_algorithm()
+        with metrics.phase('compression'):
+            compressed_digest = hash_compressed_file(self.artifact_path, algorithm)
+        compressed_size = compressed_digest[1]
+        if compressed_size > size * self.max_compression_ratio:
+            log.info(f'{self.artifact_path} does not compress well, it is sent uncompressed')
+            return None, digest
+        log.info(f'{self.artifact_path} is sent compressed with {algorithm}, {size} bytes to {compressed_size}')
+        self.attributes.update({
+            'compression': algorithm,
+            'original_sha256': sha256,
+            'original_size': str(size),
+            'compressed_size': str(compressed_size),
+            'compression_ratio': f'{compressed_size / size:.3f}',
+        })
+        return algorithm, compressed_digest
+
     def ask_type(self):
-        artifact_types = self.colander_client.get_artifact_types()
+        artifact_types = self.lookup.get_artifact_types()
         user_choices = []
         index = 0
         print(f'Select the type of the artifact for the file {self.artifact_path}:')
@@ -89,22 +155,63 @@ class ArtifactCollector:
         return user_choices[choice][2]
 
     def collect(self):
+        start = time.monotonic()
+        with metrics.phase('hashing'):
+            digest = hash_file(self.artifact_path)
+        sha256, size, _ = digest
+        if self.force:
+            return self._upload(digest, start)
+        key = ('artifact', str(self.case_id), str(self.artifact_type['id']), sha256, size)
+        artifact = self._find_or_claim(key, sha256, size)
+        if artifact:
+            log.info(f'{self.artifact_path} has already been uploaded as the artifact #{artifact.get("id")}')
+            events.publish(ARTIFACT, self.artifact_path, 'skipped', artifact_id=artifact.get('id'))
+            metrics.record_artifact(self.artifact_path, 'skipped', size, time.monotonic() - start)
+            return artifact
+        try:
+            return self._upload(digest, start)
+        finally:
+            self.index.release(key)
+
+    def _find_or_claim(self, key: tuple, sha256: str, size: int) -> dict | None:
+        # The artifact already uploaded to the case, or None once the caller is the only one uploading
+        # this content to the case. Identical files collected in parallel wait for the first one.
+        while True:
+            owner = self.index.claim(key)
+            if owner is None:
+                artifact = self.index.get(self.case_id, self.artifact_type['id'], sha256, size)
+                if artifact:
+                    self.index.release(key)
+                return artifact
+            log.info(f'The same content as {self.artifact_path} is being uploaded, waiting for it')
+            owner.wait()
+
+    def _upload(self, digest: tuple[str, int, dict[int, str]], start: float) -> dict:
+        sha256, size, _ = digest
+        if self.pcap_summary and self.artifact_type.get('short_name') == 'PCAP':
+            self._summarize_pcap()
         log.info(f'Start the upload of {self.artifact_path}')
-        case = self.colander_client.get_case(self.case_id)
-        task_id = self.progress.add_task(f'[purple] Processing {self.artifact_path}', visible=True)
-        partial_cb = partial(ArtifactCollector.upload_progress_callback, progress=self.progress, task_id=task_id)
-        artifact = self.colander_client.upload_artifact(
-            self.artifact_path,
-            case=case,
-            artifact_type=self.artifact_type,
-            progress_callback=partial_cb,
-            extra_params={
-                'attributes': self.attributes,
-            }
-        )
-        self.progress.stop()
+        case = self.lookup.get_case(self.case_id)
+        compression, upload_digest = self._compress(digest)
+        upload = ResumableUpload(self.colander_client, self.artifact_path, self.index, digest=upload_digest,
+                                 scheduler=self.scheduler, compression=compression)
+        try:
+            upload.transfer()
+            artifact = upload.create_artifact(
+                case,
+                self.artifact_type,
+                extra_params={
+                    'attributes': self.attributes,
+                }
+            )
+        except Exception as e:
+            metrics.record_artifact(self.artifact_path, 'failed', size, time.monotonic() - start, upload.bytes_sent)
+            events.publish(ARTIFACT, self.artifact_path, 'failed', error=str(e))
+            raise
+        finally:
+            upload.release()
+        self.index.add(self.case_id, self.artifact_type['id'], sha256, size, artifact)
+        metrics.record_artifact(self.artifact_path, 'uploaded', size, time.monotonic() - start, upload.bytes_sent)
+        events.publish(ARTIFACT, self.artifact_path, 'created', artifact_id=artifact.get('id'),
+                       artifact_type=self.artifact_type.get('short_name'))
         return artifact
-
-    @staticmethod
-    def upload_progress_callback(what, percent, status, progress: Progress, task_id: TaskID):
-        progress.update(task_id, advance=percent, total=100, description=f'{what} - {status}', visible=True)
@@ -0,0 +1,127 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pirogue_colander_connector.collectors.experiment import DeviceRegistry, ExperimentCollector
+from pirogue_colander_connector.collectors.metrics import metrics
+from pirogue_colander_connector.collectors.scheduler import DEFAULT_JOBS, UploadScheduler
+from pirogue_colander_connector.commands.configure import Configuration
+
+log = logging.getLogger(__name__)
+
+
+def find_experiments(parent_path: Path, case_id: str) -> list[dict]:
+    # The experiments are named after their directory
+    return [
+        {'path': path, 'name': path.name, 'case': case_id, 'target_artifact': None}
+        for path in sorted(p.parent for p in parent_path.glob('*/experiment.json'))
+    ]
+
+
+def load_manifest(manifest_path: Path, case_id: str = None) -> list[dict]:
+    experiments = []
+    with manifest_path.open() as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                msg = f'{manifest_path}:{line_number} is not valid JSON: {e}'
+                log.error(msg)
+                raise Exception(msg)
+            if not entry.get('path') or not (entry.get('case') or case_id):
+                msg = f'{manifest_path}:{line_number} must give at least the path and the case of the experiment'
+                log.error(msg)
+                raise Exception(msg)
+            # Relative paths are relative to the manifest
+            path = manifest_path.parent / entry['path']
+            target_artifact = entry.get('target_artifact')
+            experiments.append({
+                'path': path,
+                'name': entry.get('name') or path.name,
+                'case': entry.get('case') or case_id,
+                'target_artifact': manifest_path.parent / target_artifact if target_artifact else None,
+            })
+    return experiments
+
+
+class BatchExperimentCollector:
+    default_parallel = 2
+
+    def __init__(self, experiments: list[dict], jobs: int = DEFAULT_JOBS, parallel: int = default_parallel,
+                 force: bool = False, rate_limit: int = 0, pcap_summary: bool = False):
+        configuration = Configuration()
+        if not configuration.is_valid:
+            msg = f'You Colander configuration is invalid'
+            log.error(msg)
+            raise Exception(msg)
+        if parallel < 1:
+            msg = f'The number of experiments collected in parallel must be at least 1, got {parallel}'
+            log.error(msg)
+            raise Exception(msg)
+        self.experiments = experiments
+        self.jobs = jobs
+        self.parallel = parallel
+        self.force = force
+        self.rate_limit = rate_limit
+        self.pcap_summary = pcap_summary
+        # Cases, types and devices are looked up once for all the experiments
+        self.lookup = configuration.get_colander_lookup()
+        self.index = configuration.get_artifact_index()
+        self.devices = DeviceRegistry()
+        self.results: list[dict] = []
+
+    def _collect(self, experiment: dict, scheduler: UploadScheduler):
+        start = time.monotonic()
+        result = {
+            'path': str(experiment['path']),
+            'name': experiment['name'],
+            'case': experiment['case'],
+            'status': 'created',
+            'experiment_id': None,
+            'error': None,
+        }
+        try:
+            collector = ExperimentCollector(
+                Path(experiment['path']), experiment['case'], experiment['name'],
+                target_artifact_path=experiment.get('target_artifact'),
+                force=self.force,
+                lookup=self.lookup,
+                index=self.index,
+                scheduler=scheduler,
+                devices=self.devices,
+                pcap_summary=self.pcap_summary,
+                # Experiments are collected from worker threads, the type of an unknown target artifact is OTHER
+                interactive=False,
+            )
+            created = collector.collect()
+            result['experiment_id'] = created.get('id') if created else None
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['duration'] = round(time.monotonic() - start, 3)
+        return result
+
+    def collect(self) -> list[dict]:
+        log.info(f'Collecting {len(self.experiments)} experiment(s), {self.parallel} at a time')
+        # The experiments share the upload workers, the number of simultaneous uploads stays the same
+        with metrics.phase('batch_collection'), \
+                UploadScheduler(max_workers=self.jobs, rate_limit=self.rate_limit) as scheduler, \
+                ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix='colander-experiment') as pool:
+            self.results = list(pool.map(lambda e: self._collect(e, scheduler), self.experiments))
+        self.log_summary()
+        return self.results
+
+    def log_summary(self):
+        failed = [r for r in self.results if r['status'] == 'failed']
+        log.info(f'{len(self.results) - len(failed)} experiment(s) created, {len(failed)} failed')
+        for result in failed:
+            log.error(f'Failed to collect the experiment {result["path"]}: {result["error"]}')
+
+    def write_report(self, report_path: str):
+        with open(report_path, mode='w') as out:
+            json.dump(self.results, out, indent=2)
+        log.info(f'Report written to {report_path}')
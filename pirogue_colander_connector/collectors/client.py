@@ -0,0 +1,123 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from colander_client.client import Client
+from coreapi import Client as CoreApiClient
+from coreapi.auth import TokenAuthentication
+from coreapi.exceptions import ErrorMessage
+from coreapi.transports import HTTPTransport
+from coreapi.utils import File
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
+
+from pirogue_colander_connector.collectors.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+RETRIED_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('get', 'head', 'options', 'put', 'delete')
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    def __init__(self, timeout: tuple[float, float], **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        # coreapi never sets a timeout
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class ColanderClient(Client):
+    default_connect_timeout = 10
+    default_read_timeout = 60
+    default_max_retries = 3
+    default_pool_size = 16
+    backoff = 0.5
+    max_backoff = 30
+
+    def __init__(self, base_url: str, api_key: str, connect_timeout: float = default_connect_timeout,
+                 read_timeout: float = default_read_timeout, max_retries: int = default_max_retries,
+                 pool_size: int = default_pool_size):
+        # Same as Client.__init__ but with a session keeping the connections alive between requests
+        self._base_url = base_url
+        self._api_url = f'{self._base_url}/api'
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = TimeoutHTTPAdapter((connect_timeout, read_timeout), pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        auth = TokenAuthentication(scheme='Token', token=api_key)
+        self._client = CoreApiClient(transports=[HTTPTransport(auth=auth, session=self.session)])
+        with metrics.api_call('schema'):
+            self._root_document = self._retry(
+                'schema', True, lambda: self._client.get(f'{self._api_url}/schema', format='corejson'))
+
+    def ping(self):
+        # The schema is fetched again, without retrying, to know whether the server is still reachable
+        with metrics.api_call('schema'):
+            self._client.get(f'{self._api_url}/schema', format='corejson')
+
+    def _is_idempotent(self, keys) -> bool:
+        link = self._root_document
+        for key in keys:
+            link = link[key]
+        return (link.action or 'get').lower() in IDEMPOTENT_METHODS
+
+    @staticmethod
+    def _is_transient(e: Exception, idempotent: bool) -> bool:
+        # A request which may have reached the server is only sent again if it is idempotent
+        if isinstance(e, ConnectTimeout):
+            return True
+        if not idempotent:
+            return False
+        if isinstance(e, (ConnectionError, Timeout)):
+            return True
+        if isinstance(e, ErrorMessage):
+            status = str(e.error.title).split(' ')[0]
+            return status.isdigit() and int(status) in RETRIED_STATUSES
+        return False
+
+    def _retry(self, name: str, idempotent: bool, fn, params: dict = None):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_transient(e, idempotent):
+                    raise
+                # Exponential backoff with full jitter so that parallel uploads do not retry in sync
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                log.warning(f'The call to {name} failed, retrying in {delay:.1f}s: {e}')
+                metrics.increment('retries')
+                time.sleep(delay)
+                for value in (params or {}).values():
+                    if isinstance(value, File):
+                        value.content.seek(0)
+
+    def _action(self, keys, params=None, validate=True, overrides=None,
+                action=None, encoding=None, transform=None, idempotent: bool = None):
+        name = '.'.join(keys)
+        if idempotent is None:
+            idempotent = self._is_idempotent(keys)
+        with metrics.api_call(name):
+            return self._retry(name, idempotent, lambda: super(ColanderClient, self)._action(
+                keys, params=params, validate=validate, overrides=overrides,
+                action=action, encoding=encoding, transform=transform), params=params)
+
+
+_shared_clients: dict[tuple, ColanderClient] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(base_url: str, api_key: str, **options) -> ColanderClient:
+    # A single client per server for the whole process, its connections are reused by all the collectors
+    key = (base_url, api_key, tuple(sorted(options.items())))
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            _shared_clients[key] = ColanderClient(base_url, api_key, **options)
+        return _shared_clients[key]
@@ -0,0 +1,50 @@
+import zlib
+from pathlib import Path
+from typing import Iterator
+
+from pirogue_colander_connector.collectors.index import HASH_CHUNK_SIZE, hash_chunks
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Text traces and captures, the other artifacts such as videos and APKs are already compressed
+COMPRESSED_TYPES = ('SOCKET_T', 'CRYPTO_T', 'SSLKEYLOG', 'PCAP')
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+# Fast levels, the CPU of the PiRogue is more of a limit than the ratio
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 3
+
+
+def available_algorithm() -> str:
+    return 'zstd' if zstandard else 'gzip'
+
+
+def _compressor(algorithm: str):
+    # The output only depends on the input so that the second pass sends the chunks hashed by the first one
+    if algorithm == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    # gzip container with no file name and a zero timestamp
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def iter_compressed_chunks(file_path: Path, algorithm: str, chunk_size: int = HASH_CHUNK_SIZE) -> Iterator[bytes]:
+    # Chunks of the compressed file, never more than a chunk and the output of one read are kept in memory
+    compressor = _compressor(algorithm)
+    pending = bytearray()
+    with open(file_path, mode='rb') as f:
+        while data := f.read(chunk_size):
+            pending += compressor.compress(data)
+            while len(pending) >= chunk_size:
+                yield bytes(pending[:chunk_size])
+                del pending[:chunk_size]
+    pending += compressor.flush()
+    while pending:
+        yield bytes(pending[:chunk_size])
+        del pending[:chunk_size]
+
+
+def hash_compressed_file(file_path: Path, algorithm: str) -> tuple[str, int, dict[int, str]]:
+    # Same as hash_file, for the compressed content which is not written anywhere
+    return hash_chunks(iter_compressed_chunks(file_path, algorithm))
@@ -0,0 +1,149 @@
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+UPLOAD = 'upload'
+ARTIFACT = 'artifact'
+EXPERIMENT = 'experiment'
+
+
+class EventBus:
+    # The collectors publish what they are doing, a single renderer attached by the command displays it.
+    # The progress of an upload is published at most every min_interval seconds, whatever the chunk size.
+    min_interval = 0.25
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._renderer = None
+        self._last_progress: dict[str, float] = {}
+
+    def attach(self, renderer):
+        with self._lock:
+            self._renderer = renderer
+            self._last_progress = {}
+
+    def detach(self):
+        with self._lock:
+            renderer, self._renderer = self._renderer, None
+        if renderer:
+            renderer.close()
+
+    def publish(self, event: str, path: Path | str = None, status: str = None, **fields):
+        renderer = self._renderer
+        if not renderer:
+            return
+        key = str(path)
+        now = time.monotonic()
+        with self._lock:
+            if event == UPLOAD and status == 'uploading':
+                if now - self._last_progress.get(key, 0) < self.min_interval:
+                    return
+                self._last_progress[key] = now
+            elif status in ('complete', 'failed'):
+                self._last_progress.pop(key, None)
+        renderer.render({'time': round(time.time(), 3), 'event': event, 'path': key, 'status': status, **fields})
+
+
+class JsonLinesRenderer:
+    # One compact JSON object per line for scripts and headless runs, the logs go to stderr
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self._lock = threading.Lock()
+
+    def render(self, event: dict):
+        line = json.dumps({k: v for k, v in event.items() if v is not None}, separators=(',', ':'), default=str)
+        with self._lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def close(self):
+        pass
+
+
+class RichRenderer:
+    # A single display for all the concurrent uploads: one line per running upload and a total.
+    # It is only started by the first event so that it does not get in the way of the prompts.
+    refresh_per_second = 4
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._progress = None
+        self._total_task = None
+        self._total_size = 0
+        self._tasks: dict[str, tuple] = {}
+        self._statuses: dict[str, int] = {}
+
+    def _start(self):
+        from rich.progress import BarColumn, DownloadColumn, Progress, SpinnerColumn, TextColumn, \
+            TimeElapsedColumn, TimeRemainingColumn, TransferSpeedColumn
+        self._progress = Progress(
+            SpinnerColumn(),
+            TextColumn('[progress.description]{task.description}'),
+            BarColumn(),
+            TextColumn('[progress.percentage]{task.percentage:>3.0f}%'),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            TimeRemainingColumn(),
+            TimeElapsedColumn(),
+            refresh_per_second=self.refresh_per_second,
+        )
+        self._progress.start()
+        self._total_task = self._progress.add_task('Total', total=0)
+
+    def render(self, event: dict):
+        with self._lock:
+            if not self._progress:
+                self._start()
+            if event['event'] == UPLOAD:
+                self._on_upload(event)
+            elif event['event'] == ARTIFACT:
+                self._statuses[event['status']] = self._statuses.get(event['status'], 0) + 1
+                # An upload interrupted by an error has not published its end
+                if event['path'] in self._tasks:
+                    self._progress.remove_task(self._tasks.pop(event['path'])[0])
+            summary = ', '.join(f'{n} {status}' for status, n in self._statuses.items())
+            self._progress.update(self._total_task, description=f'Total ({summary})' if summary else 'Total')
+
+    def _on_upload(self, event: dict):
+        path, status = event['path'], event['status']
+        sent, size = event.get('sent', 0), event.get('size', 0)
+        if status in ('initiated', 'resuming') and path not in self._tasks:
+            task_id = self._progress.add_task(f'[purple]{Path(path).name}', total=size, completed=sent)
+            self._tasks[path] = (task_id, sent)
+            self._total_size += size
+            self._progress.update(self._total_task, total=self._total_size, advance=sent)
+            return
+        if path not in self._tasks:
+            return
+        task_id, previous = self._tasks[path]
+        # The total advances by the bytes sent since the previous event of the upload
+        self._progress.update(self._total_task, advance=sent - previous)
+        if status in ('complete', 'failed'):
+            self._progress.remove_task(task_id)
+            del self._tasks[path]
+        else:
+            self._progress.update(task_id, completed=sent)
+            self._tasks[path] = (task_id, sent)
+
+    def close(self):
+        with self._lock:
+            if self._progress:
+                self._progress.stop()
+                self._progress = None
+
+
+RENDERERS = ('rich', 'jsonl', 'none')
+
+
+def create_renderer(name: str):
+    if name == 'jsonl':
+        return JsonLinesRenderer()
+    if name == 'none':
+        return None
+    return RichRenderer()
+
+
+# Shared by all the collectors of the process
+events = EventBus()
@@ -2,34 +2,92 @@ import json
 import logging
 import os.path
 import pathlib
+import threading
+from concurrent.futures import FIRST_EXCEPTION, Future, wait
 from pathlib import Path
 
 from colander_client.client import Client
+from requests.exceptions import ConnectionError, Timeout
 
 from pirogue_colander_connector.collectors.artifact import ArtifactCollector
+from pirogue_colander_connector.collectors.events import EXPERIMENT, events
+from pirogue_colander_connector.collectors.index import ArtifactIndex
+from pirogue_colander_connector.collectors.lookup import ColanderLookup
+from pirogue_colander_connector.collectors.metrics import metrics
+from pirogue_colander_connector.collectors.preflight import check_file
+from pirogue_colander_connector.collectors.scheduler import DEFAULT_JOBS, UploadScheduler, artifact_priority
 from pirogue_colander_connector.commands.configure import Configuration
 
 log = logging.getLogger(__name__)
 
+# Colander artifact type of each file of an experiment, the other files are uploaded as OTHER
+ARTIFACT_TYPES = {
+    'network': 'PCAP',
+    'socket_traces': 'SOCKET_T',
+    'crypto_traces': 'CRYPTO_T',
+    'sslkeylog': 'SSLKEYLOG',
+    'screen': 'VIDEO',
+}
+# Colander does not create an experiment without them
+REQUIRED_FILES = ('network', 'socket_traces', 'sslkeylog')
+
+
+class DeviceRegistry:
+    # Devices resolved by the experiments of a run, a handset used by several experiments is only
+    # looked up or created once
+    def __init__(self):
+        self._devices: dict[tuple[str, str], dict] = {}
+        self._locks: dict[tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, case_id: str, device_name: str, create):
+        key = (str(case_id), device_name)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._devices:
+                self._devices[key] = create()
+            return self._devices[key]
+
 
 class ExperimentCollector:
+    default_jobs = DEFAULT_JOBS
     colander_client: Client
+    lookup: ColanderLookup
     case_id: str
     experiment_path: pathlib.Path
     experiment_details_path: str
     experiment_name: str
     target_device: dict = None
     target_artifact_path: pathlib.Path = None
-    artifacts = {}
+    artifacts: dict
+    experiment: dict = None
 
     def __init__(self, experiment_path: pathlib.Path, case_id: str, experiment_name: str,
-                 target_artifact_path: pathlib.Path = None):
-        configuration = Configuration()
-        if not configuration.is_valid:
-            msg = f'You Colander configuration is invalid'
-            log.error(msg)
-            return
-        self.colander_client = configuration.get_colander_client()
+                 target_artifact_path: pathlib.Path = None, force: bool = False, jobs: int = default_jobs,
+                 rate_limit: int = 0, lookup: ColanderLookup = None, index: ArtifactIndex = None,
+                 scheduler: UploadScheduler = None, devices: DeviceRegistry = None, pcap_summary: bool = False,
+                 interactive: bool = None):
+        if not lookup or not index:
+            configuration = Configuration()
+            if not configuration.is_valid:
+                msg = f'You Colander configuration is invalid'
+                log.error(msg)
+                return
+            lookup = lookup or configuration.get_colander_lookup()
+            index = index or configuration.get_artifact_index()
+        self.lookup = lookup
+        self.colander_client = self.lookup.colander_client
+        self.index = index
+        # The scheduler and the devices are shared by the experiments of a batch
+        self.scheduler = scheduler
+        self.devices = devices or DeviceRegistry()
+        self.force = force
+        self.jobs = jobs
+        self.rate_limit = rate_limit
+        self.pcap_summary = pcap_summary
+        self.interactive = interactive
+        self.artifacts = {}
         self.experiment_path = experiment_path
         self.case_id = case_id
         self.experiment_name = experiment_name
@@ -44,51 +102,127 @@ class ExperimentCollector:
             log.error(msg)
             raise Exception(msg)
 
-    def __ensure_file_exists(self, details: dict):
-        filename: str = details.get('file')
-        file_path = f'{self.experiment_path}/{filename}'
-        if not os.path.exists(file_path) or not os.path.isfile(file_path):
-            with open(file_path, mode='w') as out:
-                if filename.endswith('.json'):
-                    out.write('[]')
-                else:
-                    out.write('\n')
+    @staticmethod
+    def __write_placeholder(file_path: Path):
+        with open(file_path, mode='w') as out:
+            if file_path.suffix == '.json':
+                out.write('[]')
+            else:
+                out.write('\n')
 
-    def collect(self):
+    def __preflight(self, experiment_details: dict) -> dict:
+        # All the files are checked before the first upload, the problems are reported at once
+        problems = []
+        if self.target_artifact_path and not self.target_artifact_path.is_file():
+            problems.append(f'the target artifact {self.target_artifact_path} is not a file')
+        files_to_collect = {}
+        for file_type, details in experiment_details.items():
+            filename = details.get('file')
+            file_path = self.experiment_path / filename if filename else None
+            if not file_path:
+                problems.append(f'the {file_type} file is not given')
+                continue
+            if not file_path.is_file() and file_type in REQUIRED_FILES:
+                # Colander needs the required files to create the experiment, an empty one is uploaded instead
+                log.warning(f'The {file_type} file {filename} is missing, an empty one is uploaded instead')
+                self.__write_placeholder(file_path)
+            elif not file_path.is_file():
+                log.warning(f'The {file_type} file {filename} is missing, it is left out of the experiment')
+                continue
+            try:
+                has_content = check_file(file_path)
+            except (ValueError, OSError) as e:
+                problems.append(f'the {file_type} file {filename} is not valid: {e}')
+                continue
+            if not has_content and file_type not in REQUIRED_FILES:
+                log.info(f'The {file_type} file {filename} is empty, it is left out of the experiment')
+                continue
+            if not has_content:
+                log.warning(f'The {file_type} file {filename} is empty')
+            files_to_collect[file_type] = details
+        if problems:
+            msg = f'The experiment {self.experiment_path} has not been uploaded: {"; ".join(problems)}'
+            log.error(msg)
+            raise Exception(msg)
+        return files_to_collect
+
+    def collect(self) -> dict:
+        try:
+            with metrics.phase('experiment_collection'):
+                self.__collect()
+        except Exception as e:
+            events.publish(EXPERIMENT, self.experiment_path, 'failed', name=self.experiment_name, error=str(e))
+            raise
+        events.publish(EXPERIMENT, self.experiment_path, 'created', name=self.experiment_name,
+                       experiment_id=self.experiment.get('id'))
+        return self.experiment
+
+    def __collect(self):
         log.info(f'Reading the experiment details from {self.experiment_details_path}')
         with open(self.experiment_details_path) as f:
             experiment_details = json.load(f)
-        target_artifact = None
-        if self.target_artifact_path:
-            ta = ArtifactCollector(
-                case_id=self.case_id,
-                artifact_path=self.target_artifact_path,
-            )
-            target_artifact = ta.collect()
-        for file_type, details in experiment_details.items():
-            log.info(f'Dispatch collection of the {file_type} artifact')
-            self.__ensure_file_exists(details)
-            self.__dispatch_collection(file_type, details)
+        with metrics.phase('preflight'):
+            experiment_details = self.__preflight(experiment_details)
+        scheduler = self.scheduler or UploadScheduler(max_workers=self.jobs, rate_limit=self.rate_limit)
+        try:
+            # The collectors are built upfront since the target artifact may prompt for its type
+            collectors: dict[str, ArtifactCollector | DeviceCollector] = {}
+            if self.target_artifact_path:
+                collectors['target_artifact'] = self.__create_collector(
+                    self.target_artifact_path, None, {}, scheduler)
+            for file_type, details in experiment_details.items():
+                collectors[file_type] = self.__prepare_collection(file_type, details, scheduler)
+            futures: dict[Future, str] = {}
+            for file_type, collector in collectors.items():
+                log.info(f'Dispatch collection of the {file_type} artifact')
+                futures[scheduler.submit(collector.collect, priority=collector.priority)] = file_type
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+            done, _ = wait(futures)
+        finally:
+            if not self.scheduler:
+                scheduler.shutdown()
+
+        failures = {futures[f]: f.exception() for f in done if not f.cancelled() and f.exception()}
+        if failures:
+            for file_type, e in failures.items():
+                log.error(f'Failed to collect the {file_type} artifact: {e}')
+            msg = (f'Unable to collect {", ".join(failures)}, the experiment has not been created. '
+                   f'Run the same command again to resume the upload')
+            log.error(msg)
+            errors = list(failures.values())
+            # Raised as it is so that the spool postpones the upload instead of counting an attempt
+            if all(isinstance(e, (ConnectionError, Timeout)) for e in errors):
+                raise errors[0]
+            raise Exception(msg) from errors[0]
+
+        for future, file_type in futures.items():
+            self.artifacts[file_type] = future.result()
+        self.target_device = self.artifacts.pop('device', None)
+        target_artifact = self.artifacts.pop('target_artifact', None)
         pcap = self.artifacts.pop('network', None)
         socket_trace = self.artifacts.pop('socket_traces', None)
         sslkeylog = self.artifacts.pop('sslkeylog', None)
         crypto_traces = self.artifacts.pop('crypto_traces', None)
         screen = self.artifacts.pop('screen', None)
-        experiment = self.colander_client.create_pirogue_experiment(
-            name=self.experiment_name,
-            case=self.colander_client.get_case(self.case_id),
-            pcap=pcap,
-            socket_trace=socket_trace,
-            sslkeylog=sslkeylog,
-            extra_params={
-                'screencast': screen,
-                'aes_trace': crypto_traces,
-                'target_device': self.target_device,
-                'target_artifact': target_artifact,
-                'extra_files': list(self.artifacts.values())
-            }
-        )
-        experiment_id = experiment.get('id')
+        case = self.lookup.get_case(self.case_id)
+        with metrics.phase('experiment_creation'):
+            self.experiment = self.colander_client.create_pirogue_experiment(
+                name=self.experiment_name,
+                case=case,
+                pcap=pcap,
+                socket_trace=socket_trace,
+                sslkeylog=sslkeylog,
+                extra_params={
+                    'screencast': screen,
+                    'aes_trace': crypto_traces,
+                    'target_device': self.target_device,
+                    'target_artifact': target_artifact,
+                    'extra_files': list(self.artifacts.values())
+                }
+            )
+        experiment_id = self.experiment.get('id')
         log.info(f'Your experiment {self.experiment_name} [#{experiment_id}] has been successfully created!')
 
     def __create_device(self, device_details: dict):
@@ -96,7 +230,11 @@ class ExperimentCollector:
         model = device_details.get('model', 'no model')
         imei = device_details.get('imei', 'xxx')
         device_name = f'{brand} - {model} ({imei})'
-        case = self.colander_client.get_case(self.case_id)
+        return self.devices.get_or_create(self.case_id, device_name,
+                                          lambda: self.__find_or_create_device(device_name, device_details))
+
+    def __find_or_create_device(self, device_name: str, device_details: dict):
+        case = self.lookup.get_case(self.case_id)
         devices = self.colander_client.get_devices(case=case, name=device_name)
         if devices:
             device = devices[0]
@@ -104,76 +242,53 @@ class ExperimentCollector:
             device = self.colander_client.create_device(
                 name=device_name,
                 case=case,
-                device_type=self.colander_client.get_device_type_by_short_name('MOBILE'),
+                device_type=self.lookup.get_device_type_by_short_name('MOBILE'),
                 extra_params={
                     'attributes': device_details
                 }
             )
         return device
 
-    def __dispatch_collection(self, file_type: str, details: dict):
+    def __create_collector(self, file_path: Path, artifact_type_name: str | None, attributes: dict,
+                           scheduler: UploadScheduler):
+        return ArtifactCollector(
+            case_id=self.case_id,
+            artifact_path=file_path,
+            artifact_type_name=artifact_type_name,
+            attributes=attributes,
+            lookup=self.lookup,
+            index=self.index,
+            force=self.force,
+            scheduler=scheduler,
+            pcap_summary=self.pcap_summary,
+            interactive=self.interactive,
+        )
+
+    def __prepare_collection(self, file_type: str, details: dict, scheduler: UploadScheduler):
         filename = details.pop('file')
         file_path = Path(f'{self.experiment_path}/{filename}')
         if not file_path.exists() or not file_path.is_file():
             msg = f'{file_path} not found'
             log.error(msg)
             raise Exception(msg)
-        if file_type == 'network':
-            ac = ArtifactCollector(
-                case_id=self.case_id,
-                artifact_path=file_path,
-                artifact_type_name='PCAP',
-                attributes=details,
-            )
-            artifact = ac.collect()
-            self.artifacts[file_type] = artifact
-        elif file_type == 'socket_traces':
-            ac = ArtifactCollector(
-                case_id=self.case_id,
-                artifact_path=file_path,
-                artifact_type_name='SOCKET_T',
-                attributes=details,
-            )
-            artifact = ac.collect()
-            self.artifacts[file_type] = artifact
-        elif file_type == 'crypto_traces':
-            ac = ArtifactCollector(
-                case_id=self.case_id,
-                artifact_path=file_path,
-                artifact_type_name='CRYPTO_T',
-                attributes=details,
-            )
-            artifact = ac.collect()
-            self.artifacts[file_type] = artifact
-        elif file_type == 'sslkeylog':
-            ac = ArtifactCollector(
-                case_id=self.case_id,
-                artifact_path=file_path,
-                artifact_type_name='SSLKEYLOG',
-                attributes=details,
-            )
-            artifact = ac.collect()
-            self.artifacts[file_type] = artifact
-        elif file_type == 'screen':
-            ac = ArtifactCollector(
-                case_id=self.case_id,
-                artifact_path=file_path,
-                artifact_type_name='VIDEO',
-                attributes=details,
-            )
-            artifact = ac.collect()
-            self.artifacts[file_type] = artifact
-        elif file_type == 'device':
-            with file_path.open('r') as f:
-                device_details = json.load(f)
-            self.target_device = self.__create_device(device_details)
-        else:
-            ac = ArtifactCollector(
-                case_id=self.case_id,
-                artifact_path=file_path,
-                artifact_type_name='OTHER',
-                attributes=details,
-            )
-            artifact = ac.collect()
-            self.artifacts[file_type] = artifact
+        if file_type == 'device':
+            return DeviceCollector(self, file_path)
+        artifact_type_name = ARTIFACT_TYPES.get(file_type, 'OTHER')
+        return self.__create_collector(file_path, artifact_type_name, details, scheduler)
+
+    def create_device(self, file_path: Path):
+        with file_path.open('r') as f:
+            device_details = json.load(f)
+        with metrics.phase('device_lookup'):
+            return self.__create_device(device_details)
 
+
+class DeviceCollector:
+    priority = artifact_priority('DEVICE', 0)
+
+    def __init__(self, experiment_collector: ExperimentCollector, file_path: Path):
+        self.experiment_collector = experiment_collector
+        self.file_path = file_path
+
+    def collect(self):
+        return self.experiment_collector.create_device(self.file_path)
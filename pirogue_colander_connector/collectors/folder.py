@@ -1,15 +1,42 @@
 import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from pathlib import Path
+from typing import Iterator
 
 from pirogue_colander_connector.collectors.artifact import ArtifactCollector
 from pirogue_colander_connector.collectors.ignore import ColanderIgnoreFile
+from pirogue_colander_connector.collectors.metrics import metrics
+from pirogue_colander_connector.collectors.scheduler import DEFAULT_JOBS, UploadScheduler
+from pirogue_colander_connector.collectors.sync import SyncManifest
 from pirogue_colander_connector.commands.configure import Configuration
 
 log = logging.getLogger(__name__)
 
 
+def walk_folder(folder_path: Path, colander_ignore: ColanderIgnoreFile, recursive: bool = False) -> Iterator[os.DirEntry]:
+    # Files are yielded as soon as they are listed, ignored sub-folders are not even listed
+    folders = [(folder_path, colander_ignore)]
+    while folders:
+        folder, ignore = folders.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if ignore.is_ignored_entry(entry):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        sub_folder = Path(entry.path)
+                        folders.append((sub_folder, ignore.for_subfolder(sub_folder)))
+                elif entry.is_file():
+                    yield entry
+
+
 class FolderCollector:
-    def __init__(self, folder_path: Path, case_id: str):
+    default_jobs = DEFAULT_JOBS
+
+    def __init__(self, folder_path: Path, case_id: str, jobs: int = default_jobs, force: bool = False,
+                 recursive: bool = False, rate_limit: int = 0, pcap_summary: bool = False,
+                 compress: bool = False, sync: bool = False):
         self.folder_path = folder_path.absolute()
         self.colander_ignore = ColanderIgnoreFile(self.folder_path)
         configuration = Configuration()
@@ -21,15 +48,101 @@ class FolderCollector:
             msg = f'The folder {self.folder_path} does not exist'
             log.error(msg)
             raise Exception(msg)
-        self.colander_client = configuration.get_colander_client()
+        if jobs < 1:
+            msg = f'The number of parallel uploads must be at least 1, got {jobs}'
+            log.error(msg)
+            raise Exception(msg)
+        self.lookup = configuration.get_colander_lookup()
+        self.index = configuration.get_artifact_index()
+        self.force = force
         self.case_id = case_id
+        self.jobs = jobs
+        self.recursive = recursive
+        self.rate_limit = rate_limit
+        self.pcap_summary = pcap_summary
+        self.compress = compress
+        # Only the new and modified files of a synchronized folder are checked and uploaded
+        self.manifest = configuration.get_sync_manifest() if sync else None
+        self._stats: dict[Path, tuple[str, os.stat_result]] = {}
+        self.succeeded: list[Path] = []
+        self.failed: dict[Path, Exception] = {}
+        self.unchanged = 0
 
     def collect(self):
+        try:
+            return self._collect()
+        finally:
+            # The files uploaded before an interruption are not checked again by the next run
+            if self.manifest:
+                self.manifest.close()
+
+    def _collect(self):
         log.info(f'Listing files contained in {self.folder_path}')
-        for f in self.folder_path.iterdir():
-            if f.is_file() and not self.colander_ignore.is_ignored(f):
-                collector = ArtifactCollector(
-                    case_id=self.case_id,
-                    artifact_path=f,
-                )
-                collector.collect()
\ No newline at end of file
+        synced = self.manifest.load(self.folder_path, self.case_id) if self.manifest else {}
+        listed: set[str] = set()
+        with metrics.phase('folder_collection'), \
+                UploadScheduler(max_workers=self.jobs, rate_limit=self.rate_limit) as scheduler:
+            pending: dict[Future, Path] = {}
+            for entry in walk_folder(self.folder_path, self.colander_ignore, recursive=self.recursive):
+                # Do not list further than needed to keep the workers busy and to prioritize the uploads
+                if len(pending) >= 4 * self.jobs:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._record_result(pending.pop(future), future)
+                f = Path(entry.path)
+                # The stat is cached by the entry and handed to the collector
+                stat = entry.stat()
+                if self.manifest:
+                    relative_path = os.path.relpath(entry.path, self.folder_path)
+                    listed.add(relative_path)
+                    if not self.force and SyncManifest.is_unchanged(synced.get(relative_path), stat):
+                        self.unchanged += 1
+                        continue
+                    self._stats[f] = (relative_path, stat)
+                # The collector is built in the main thread since it may prompt for the artifact type
+                try:
+                    collector = ArtifactCollector(
+                        case_id=self.case_id,
+                        artifact_path=f,
+                        lookup=self.lookup,
+                        index=self.index,
+                        force=self.force,
+                        scheduler=scheduler,
+                        pcap_summary=self.pcap_summary,
+                        compress=self.compress,
+                        stat=stat,
+                    )
+                    priority = collector.priority
+                except Exception as e:
+                    self.failed[f] = e
+                    continue
+                pending[scheduler.submit(collector.collect, priority=priority)] = f
+            done, _ = wait(pending)
+            for future in done:
+                self._record_result(pending[future], future)
+        if self.manifest:
+            removed = self.manifest.prune(self.folder_path, self.case_id, listed)
+            if removed:
+                log.info(f'{removed} file(s) are not in the folder anymore')
+        metrics.increment('folder_files_succeeded', len(self.succeeded))
+        metrics.increment('folder_files_unchanged', self.unchanged)
+        metrics.increment('folder_files_failed', len(self.failed))
+        self.log_summary()
+        return self.succeeded, self.failed
+
+    def _record_result(self, f: Path, future: Future):
+        try:
+            artifact = future.result()
+            self.succeeded.append(f)
+        except Exception as e:
+            self.failed[f] = e
+            return
+        if self.manifest:
+            relative_path, stat = self._stats.pop(f)
+            self.manifest.record(self.folder_path, self.case_id, relative_path, stat, artifact.get('id'))
+
+    def log_summary(self):
+        unchanged = f', {self.unchanged} unchanged since the last synchronization' if self.manifest else ''
+        log.info(f'{len(self.succeeded)} file(s) uploaded, {len(self.failed)} failed{unchanged}')
+        for f, e in self.failed.items():
+            log.error(f'Failed to upload {f}: {e}')
@@ -1,10 +1,76 @@
+import os
+import re
 from pathlib import Path
-from fnmatch import fnmatch
+
+
+def translate_glob(glob: str) -> str:
+    # Translate a gitignore glob into a regular expression, '*' and '?' do not match '/'
+    # while '**' matches any number of folders
+    regex = ''
+    i, n = 0, len(glob)
+    while i < n:
+        c = glob[i]
+        if c == '*':
+            if glob.startswith('**/', i):
+                regex += '(?:.*/)?'
+                i += 3
+                continue
+            if glob.startswith('**', i):
+                regex += '.*'
+                i += 2
+                continue
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            j = glob.find(']', i + 2 if glob.startswith('[!', i) else i + 1)
+            if j < 0:
+                regex += re.escape(c)
+            else:
+                content = glob[i + 1:j].replace('\\', '\\\\')
+                if content.startswith('!'):
+                    content = '^' + content[1:]
+                regex += f'[{content}]'
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            regex += re.escape(glob[i])
+        else:
+            regex += re.escape(c)
+        i += 1
+    return regex
+
+
+class IgnoreRule:
+    def __init__(self, pattern: str, base_folder: str = None):
+        self.pattern = pattern
+        self.negated = pattern.startswith('!')
+        glob = pattern[1:] if self.negated else pattern
+        if glob.startswith('\\!') or glob.startswith('\\#'):
+            glob = glob[1:]
+        self.directory_only = glob.endswith('/')
+        glob = glob.rstrip('/')
+        if base_folder and glob.startswith(f'{base_folder}/'):
+            # Absolute paths are still supported
+            self.prefix = ''
+        elif base_folder and '/' in glob:
+            # Like in .gitignore, a pattern containing a slash is relative to the folder of the ignore file
+            self.prefix = re.escape(base_folder) + '/'
+            glob = glob.lstrip('/')
+        elif base_folder:
+            self.prefix = re.escape(base_folder) + '/(?:.*/)?'
+        else:
+            self.prefix = '(?:.*/)?'
+        regex = translate_glob(glob)
+        # Both the matching files and folders are ignored as well as everything they contain,
+        # directory only patterns just ignore the content of the matching folders
+        self.folder_regex = f'{regex}(?:/.*)?'
+        self.file_regex = f'{regex}/.*' if self.directory_only else self.folder_regex
 
 
 class ColanderIgnoreFile:
     ignore_file_name = '.colander_ignore'
-    default_ignore_patterns = {
+    default_ignore_patterns = (
         ignore_file_name,
         '*.metadata.json',
         '*.pid',
@@ -13,27 +79,68 @@ class ColanderIgnoreFile:
         '*.crt',
         '*.pem',
         '*.md',
-    }
+    )
 
-    def __init__(self, path: Path) -> None:
+    def __init__(self, path: Path, parent: 'ColanderIgnoreFile' = None) -> None:
         self.path: Path = path
-        self.ignored_patterns: set[str] = self.default_ignore_patterns
         if path.is_file():
             self.ignore_file_path = path.parent / self.ignore_file_name
         else:
             self.ignore_file_path: Path = self.path / self.ignore_file_name
+        self.base_folder = os.path.abspath(self.ignore_file_path.parent)
+        if parent:
+            # Patterns of the parent folders also apply to the sub-folders
+            self.rules: list[IgnoreRule] = list(parent.rules)
+        else:
+            self.rules: list[IgnoreRule] = [IgnoreRule(p) for p in self.default_ignore_patterns]
+        self._file_matcher = None
+        self._folder_matcher = None
         self.load_ignore_file()
 
-    def is_ignored(self, path: Path) -> bool:
-        for pattern in self.ignored_patterns:
-            if fnmatch(path.name, pattern):
-                return True
-            elif fnmatch(str(path), pattern):
-                return True
-        return False
+    @property
+    def ignored_patterns(self) -> list[str]:
+        return [rule.pattern for rule in self.rules]
+
+    def _compile(self):
+        self._file_matcher = self._combine(lambda rule: rule.file_regex)
+        self._folder_matcher = self._combine(lambda rule: rule.folder_regex)
+
+    def _combine(self, get_regex) -> re.Pattern:
+        # All the rules are combined in a single regular expression. The alternatives are listed
+        # in reverse order so that the matching one is the last rule of the file, which wins.
+        # Consecutive rules sharing the same prefix are grouped to match the prefix only once.
+        groups: list[tuple[str, list[str]]] = []
+        for i in reversed(range(len(self.rules))):
+            rule = self.rules[i]
+            if not groups or groups[-1][0] != rule.prefix:
+                groups.append((rule.prefix, []))
+            groups[-1][1].append(f'(?P<r{i}>{get_regex(rule)})')
+        alternatives = [f'{prefix}(?:{"|".join(regexes)})' for prefix, regexes in groups]
+        return re.compile('|'.join(alternatives) or '(?!)', re.DOTALL)
+
+    def is_ignored(self, path: Path, is_dir: bool = False) -> bool:
+        return self._is_ignored(os.path.abspath(path), is_dir)
+
+    def is_ignored_entry(self, entry: os.DirEntry) -> bool:
+        return self._is_ignored(entry.path, entry.is_dir(follow_symlinks=False))
+
+    def _is_ignored(self, path: str, is_dir: bool) -> bool:
+        if self._file_matcher is None:
+            self._compile()
+        match = (self._folder_matcher if is_dir else self._file_matcher).fullmatch(path)
+        if not match:
+            return False
+        return not self.rules[int(match.lastgroup[1:])].negated
+
+    def for_subfolder(self, path: Path) -> 'ColanderIgnoreFile':
+        if not (path / self.ignore_file_name).is_file():
+            return self
+        return ColanderIgnoreFile(path, parent=self)
 
     def add_ignored_pattern(self, pattern: str) -> None:
-        self.ignored_patterns.add(pattern)
+        if pattern not in self.ignored_patterns:
+            self.rules.append(IgnoreRule(pattern, self.base_folder))
+            self._file_matcher = None
 
     def save_ignore_file(self):
         with self.ignore_file_path.open('w') as file:
@@ -46,4 +153,4 @@ class ColanderIgnoreFile:
                 for line in f.readlines():
                     if line.startswith('#') or not line.strip():
                         continue
-                    self.ignored_patterns.add(line.strip())
+                    self.add_ignored_pattern(line.strip())
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from colander_client.client import Client
+
+from pirogue_colander_connector.collectors.lookup import to_primitive
+
+log = logging.getLogger(__name__)
+
+# Must match the size of the chunks sent to Colander, see ResumableUpload
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_chunks(chunks: Iterable[bytes]) -> tuple[str, int, dict[int, str]]:
+    # The digest of each chunk is computed along the way as Colander needs them to initiate the upload
+    digester = hashlib.sha256()
+    digests = {}
+    size = 0
+    for chunk in chunks:
+        digester.update(chunk)
+        digests[size] = hashlib.sha256(chunk).hexdigest()
+        size += len(chunk)
+    return digester.hexdigest(), size, digests
+
+
+def read_chunks(file_path: Path, offset: int = 0) -> Iterator[bytes]:
+    with open(file_path, mode='rb') as f:
+        f.seek(offset)
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            yield chunk
+
+
+def hash_file(file_path: Path) -> tuple[str, int, dict[int, str]]:
+    # Read by chunks so that multi-GB captures never have to fit in memory
+    return hash_chunks(read_chunks(file_path))
+
+
+class ArtifactIndex:
+    # Uploads running in the process, shared by all the indexes: the same content must not be
+    # uploaded twice at the same time
+    _in_flight: dict[tuple, threading.Event] = {}
+    _in_flight_lock = threading.Lock()
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(index_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS artifacts ('
+                'case_id TEXT NOT NULL, type_id TEXT NOT NULL, sha256 TEXT NOT NULL, size INTEGER NOT NULL, '
+                'artifact_id TEXT NOT NULL, artifact TEXT NOT NULL, '
+                'PRIMARY KEY (case_id, type_id, sha256, size))'
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS uploads ('
+                'sha256 TEXT NOT NULL, size INTEGER NOT NULL, '
+                'upload_request_id TEXT NOT NULL, addr INTEGER NOT NULL, '
+                'PRIMARY KEY (sha256, size))'
+            )
+
+    def get(self, case_id: str, type_id: str, sha256: str, size: int) -> dict | None:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT artifact FROM artifacts WHERE case_id = ? AND type_id = ? AND sha256 = ? AND size = ?',
+                (str(case_id), str(type_id), sha256, size)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, case_id: str, type_id: str, sha256: str, size: int, artifact: dict):
+        artifact = to_primitive(artifact)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO artifacts (case_id, type_id, sha256, size, artifact_id, artifact) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (str(case_id), str(type_id), sha256, size, str(artifact.get('id')), json.dumps(artifact))
+            )
+
+    def clear(self, case_id: str):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM artifacts WHERE case_id = ?', (str(case_id),))
+
+    def rebuild(self, colander_client: Client, case_id: str) -> int:
+        log.info(f'Rebuilding the index of the artifacts of the case {case_id}')
+        # The Colander client does not expose the listing of the artifacts
+        artifacts = colander_client._action(['artifacts', 'list'], {'case_id': case_id}, validate=False)
+        self.clear(case_id)
+        count = 0
+        for artifact in artifacts:
+            if artifact.get('case', case_id) != case_id:
+                continue
+            type_id = artifact.get('type')
+            sha256 = artifact.get('sha256')
+            size = artifact.get('size_in_bytes')
+            if type_id is None or not sha256 or size is None:
+                continue
+            # The type may be nested depending on the version of Colander
+            if isinstance(type_id, dict):
+                type_id = type_id.get('id')
+            self.add(case_id, type_id, sha256, int(size), artifact)
+            count += 1
+        log.info(f'{count} artifact(s) indexed')
+        return count
+
+    def get_checkpoint(self, sha256: str, size: int) -> tuple[str, int] | None:
+        with self._lock:
+            return self._connection.execute(
+                'SELECT upload_request_id, addr FROM uploads WHERE sha256 = ? AND size = ?',
+                (sha256, size)
+            ).fetchone()
+
+    def save_checkpoint(self, sha256: str, size: int, upload_request_id: str, addr: int):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO uploads (sha256, size, upload_request_id, addr) VALUES (?, ?, ?, ?)',
+                (sha256, size, str(upload_request_id), addr)
+            )
+
+    def discard_checkpoint(self, sha256: str, size: int):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM uploads WHERE sha256 = ? AND size = ?', (sha256, size))
+
+    def claim(self, key: tuple) -> threading.Event | None:
+        # None if the caller now owns the key, otherwise an event set once its owner releases it
+        with self._in_flight_lock:
+            if key in self._in_flight:
+                return self._in_flight[key]
+            self._in_flight[key] = threading.Event()
+            return None
+
+    def release(self, key: tuple):
+        with self._in_flight_lock:
+            event = self._in_flight.pop(key, None)
+        if event:
+            event.set()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
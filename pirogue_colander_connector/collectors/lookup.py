@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
+
+from pirogue_colander_connector.collectors.metrics import metrics
+
+if TYPE_CHECKING:
+    from colander_client.client import Client
+
+log = logging.getLogger(__name__)
+
+
+def to_primitive(value):
+    # The Colander client returns immutable coreapi objects which cannot be serialized as is
+    if isinstance(value, Mapping):
+        return {k: to_primitive(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_primitive(v) for v in value]
+    return value
+
+
+# Cases, artifact types and device types are fetched once per run and optionally persisted on disk
+# to be reused by the next runs until they expire.
+class ColanderLookup:
+    cache_version = 1
+
+    def __init__(self, colander_client: 'Client', cache_path: str = None, ttl: int = 0):
+        self.colander_client = colander_client
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._entries: dict[str, dict] = {}
+        self._lock = threading.RLock()
+        self._load_cache()
+
+    @property
+    def persistent(self) -> bool:
+        return bool(self.cache_path) and self.ttl > 0
+
+    def _load_cache(self):
+        if not self.persistent or not os.path.isfile(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, mode='r') as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            log.warning(f'Ignoring the unreadable Colander cache {self.cache_path}: {e}')
+            return
+        # Objects cached for another server or by another version are not reused
+        if cache.get('version') != self.cache_version or cache.get('base_url') != self.colander_client._base_url:
+            return
+        now = time.time()
+        self._entries = {
+            key: entry for key, entry in cache.get('entries', {}).items()
+            if now - entry.get('timestamp', 0) < self.ttl
+        }
+
+    def _save_cache(self):
+        if not self.persistent:
+            return
+        cache = {
+            'version': self.cache_version,
+            'base_url': self.colander_client._base_url,
+            'entries': self._entries,
+        }
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, mode='w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmp_path, self.cache_path)
+
+    def _get(self, key: str, fetch):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (not self.persistent or time.time() - entry['timestamp'] < self.ttl):
+                metrics.increment('lookup_cache_hits')
+                return entry['value']
+            metrics.increment('lookup_cache_misses')
+            with metrics.phase('lookup'):
+                value = fetch()
+            self._entries[key] = {'timestamp': time.time(), 'value': value}
+            self._save_cache()
+            return value
+
+    def invalidate(self, key: str = None):
+        with self._lock:
+            if key:
+                self._entries.pop(key, None)
+            else:
+                self._entries.clear()
+            self._save_cache()
+
+    def get_case(self, case_id: str) -> dict:
+        return self._get(f'case:{case_id}', lambda: to_primitive(self.colander_client.get_case(case_id)))
+
+    def get_artifact_types(self) -> list[dict]:
+        return self._get('artifact_types', lambda: to_primitive(self.colander_client.get_artifact_types()))
+
+    def find_artifact_type_by_short_name(self, short_name: str) -> dict | None:
+        for t in self.get_artifact_types():
+            if t['short_name'] == short_name:
+                return t
+        return None
+
+    def get_artifact_type_by_short_name(self, short_name: str) -> dict:
+        artifact_type = self.find_artifact_type_by_short_name(short_name)
+        if not artifact_type:
+            raise Exception(f'artifact type does not exist: {short_name}')
+        return artifact_type
+
+    def get_device_types(self) -> list[dict]:
+        return self._get('device_types', lambda: to_primitive(self.colander_client.get_device_types()))
+
+    def get_device_type_by_short_name(self, short_name: str) -> dict:
+        for t in self.get_device_types():
+            if t['short_name'] == short_name:
+                return t
+        raise Exception(f'device type does not exist: {short_name}')
+
+    @staticmethod
+    def clear_cache(cache_path: str):
+        if os.path.isfile(cache_path):
+            os.remove(cache_path)
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    prometheus_prefix = 'pirogue_colander'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._started = time.monotonic()
+            # Phases run concurrently, their durations are the sum of the time spent by every thread
+            self.phases: dict[str, dict] = {}
+            self.api_calls: dict[str, dict] = {}
+            self.counters: dict[str, int] = {}
+            self.artifacts: list[dict] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._add_duration(self.phases, name, time.monotonic() - start)
+
+    @contextmanager
+    def api_call(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._add_duration(self.api_calls, name, time.monotonic() - start)
+
+    def _add_duration(self, durations: dict, name: str, seconds: float):
+        with self._lock:
+            entry = durations.setdefault(name, {'count': 0, 'seconds': 0.0})
+            entry['count'] += 1
+            entry['seconds'] += seconds
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_artifact(self, path, status: str, size: int, seconds: float, sent: int = 0):
+        with self._lock:
+            self.artifacts.append({
+                'path': str(path),
+                'status': status,
+                'size': size,
+                'bytes_sent': sent,
+                'seconds': round(seconds, 6),
+                'throughput': round(sent / seconds, 2) if sent and seconds else 0,
+            })
+
+    def report(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            bytes_sent = self.counters.get('bytes_sent', 0)
+            transfer_seconds = self.phases.get('transfer', {}).get('seconds', 0)
+            statuses = {}
+            for artifact in self.artifacts:
+                statuses[artifact['status']] = statuses.get(artifact['status'], 0) + 1
+            return {
+                'started_at': self.started_at,
+                'duration': round(elapsed, 6),
+                'bytes_sent': bytes_sent,
+                'throughput': round(bytes_sent / elapsed, 2) if elapsed else 0,
+                # Throughput of a single upload, whatever the number of simultaneous uploads
+                'transfer_throughput': round(bytes_sent / transfer_seconds, 2) if transfer_seconds else 0,
+                'artifacts': statuses,
+                'phases': {k: dict(v) for k, v in self.phases.items()},
+                'api_calls': {k: dict(v) for k, v in self.api_calls.items()},
+                'counters': dict(self.counters),
+                'uploads': list(self.artifacts),
+            }
+
+    def write_json(self, path: str):
+        with open(path, mode='w') as out:
+            json.dump(self.report(), out, indent=2)
+
+    def write_prometheus(self, path: str):
+        report = self.report()
+        p = self.prometheus_prefix
+        lines = [
+            f'# TYPE {p}_last_run_timestamp_seconds gauge',
+            f'{p}_last_run_timestamp_seconds {report["started_at"]}',
+            f'# TYPE {p}_run_duration_seconds gauge',
+            f'{p}_run_duration_seconds {report["duration"]}',
+            f'# TYPE {p}_bytes_sent gauge',
+            f'{p}_bytes_sent {report["bytes_sent"]}',
+            f'# TYPE {p}_throughput_bytes_per_second gauge',
+            f'{p}_throughput_bytes_per_second {report["throughput"]}',
+            f'# TYPE {p}_artifacts gauge',
+        ]
+        lines += [f'{p}_artifacts{{status="{k}"}} {v}' for k, v in report['artifacts'].items()]
+        lines.append(f'# TYPE {p}_phase_seconds gauge')
+        lines += [f'{p}_phase_seconds{{phase="{k}"}} {v["seconds"]}' for k, v in report['phases'].items()]
+        lines.append(f'# TYPE {p}_api_calls gauge')
+        lines += [f'{p}_api_calls{{call="{k}"}} {v["count"]}' for k, v in report['api_calls'].items()]
+        lines.append(f'# TYPE {p}_api_call_seconds gauge')
+        lines += [f'{p}_api_call_seconds{{call="{k}"}} {v["seconds"]}' for k, v in report['api_calls'].items()]
+        lines.append(f'# TYPE {p}_events gauge')
+        lines += [f'{p}_events{{event="{k}"}} {v}' for k, v in report['counters'].items() if k != 'bytes_sent']
+        # The textfile collector of the node exporter may read the file at any time
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, mode='w') as out:
+            out.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+# Shared by all the collectors of the process
+metrics = Metrics()
@@ -0,0 +1,314 @@
+import ipaddress
+import logging
+import struct
+from datetime import datetime, timezone
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+# Larger records can only come from a corrupted capture, they would be buffered forever
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+PROTOCOLS = {1: 'ICMP', 6: 'TCP', 17: 'UDP', 58: 'ICMPv6'}
+
+PCAP_MAGICS = {
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6), b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9), b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+}
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+
+
+class PcapSummary:
+    # The tables are bounded so that the memory stays constant whatever the size of the capture,
+    # the packets of the flows and hosts seen once the tables are full are only counted in the totals
+    max_flows = 50000
+    max_hosts = 50000
+    max_names = 5000
+    top = 20
+
+    def __init__(self):
+        self._buffer = b''
+        self._parse = self._parse_header
+        self._byte_order = '<'
+        self._resolution = 1e-6
+        self._link_type = None
+        self._interfaces: list[tuple[int, float]] = []
+        self.link_types: set[int] = set()
+        self.packets = 0
+        self.bytes = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.flows: dict[tuple, list[int]] = {}
+        self.hosts: dict[str, int] = {}
+        self.dns_names: dict[str, int] = {}
+        self.sni_names: dict[str, int] = {}
+        self.protocols: dict[str, int] = {}
+
+    def feed(self, data: bytes):
+        # Only the incomplete record at the end of the data is kept for the next call
+        buffer = self._buffer + data if self._buffer else data
+        offset = self._parse(memoryview(buffer))
+        self._buffer = buffer[offset:]
+
+    # File formats
+
+    def _parse_header(self, view: memoryview) -> int:
+        if len(view) < 24:
+            return 0
+        magic = bytes(view[:4])
+        if magic == PCAPNG_MAGIC:
+            self._parse = self._parse_pcapng
+            return self._parse_pcapng(view)
+        if magic not in PCAP_MAGICS:
+            raise ValueError('Not a pcap or pcapng file')
+        self._byte_order, self._resolution = PCAP_MAGICS[magic]
+        self._link_type = struct.unpack_from(f'{self._byte_order}I', view, 20)[0]
+        self.link_types.add(self._link_type)
+        self._record_header = struct.Struct(f'{self._byte_order}IIII')
+        self._parse = self._parse_pcap
+        return 24 + self._parse_pcap(view[24:])
+
+    def _parse_pcap(self, view: memoryview) -> int:
+        offset = 0
+        header = self._record_header
+        while offset + 16 <= len(view):
+            seconds, fraction, captured, original = header.unpack_from(view, offset)
+            if captured > MAX_RECORD_SIZE:
+                raise ValueError('Invalid pcap record')
+            if offset + 16 + captured > len(view):
+                break
+            packet = view[offset + 16:offset + 16 + captured]
+            self._on_packet(self._link_type, seconds + fraction * self._resolution, packet, original)
+            offset += 16 + captured
+        return offset
+
+    def _parse_pcapng(self, view: memoryview) -> int:
+        offset = 0
+        while offset + 12 <= len(view):
+            if bytes(view[offset:offset + 4]) == PCAPNG_MAGIC:
+                # Each section header gives the byte order of its blocks
+                self._byte_order = '<' if bytes(view[offset + 8:offset + 12]) == b'\x4d\x3c\x2b\x1a' else '>'
+                self._interfaces = []
+            block_type, length = struct.unpack_from(f'{self._byte_order}II', view, offset)
+            if length < 12 or length > MAX_RECORD_SIZE:
+                raise ValueError('Invalid pcapng block')
+            if offset + length > len(view):
+                break
+            self._on_block(block_type, view[offset + 8:offset + length - 4])
+            offset += length
+        return offset
+
+    def _on_block(self, block_type: int, body: memoryview):
+        order = self._byte_order
+        if block_type == 1:
+            link_type, _, _ = struct.unpack_from(f'{order}HHI', body)
+            self.link_types.add(link_type)
+            self._interfaces.append((link_type, self._interface_resolution(body[8:])))
+        elif block_type == 6:
+            interface, high, low, captured, original = struct.unpack_from(f'{order}IIIII', body)
+            link_type, resolution = self._interfaces[interface]
+            self._on_packet(link_type, ((high << 32) | low) * resolution, body[20:20 + captured], original)
+        elif block_type == 3:
+            original, = struct.unpack_from(f'{order}I', body)
+            link_type, _ = self._interfaces[0]
+            self._on_packet(link_type, None, body[4:4 + original], original)
+        elif block_type == 2:
+            interface, _, high, low, captured, original = struct.unpack_from(f'{order}HHIIII', body)
+            link_type, resolution = self._interfaces[interface]
+            self._on_packet(link_type, ((high << 32) | low) * resolution, body[20:20 + captured], original)
+
+    def _interface_resolution(self, options: memoryview) -> float:
+        offset = 0
+        while offset + 4 <= len(options):
+            code, length = struct.unpack_from(f'{self._byte_order}HH', options, offset)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                value = options[offset + 4]
+                return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+            offset += 4 + (length + 3) // 4 * 4
+        return 1e-6
+
+    # Protocols
+
+    def _on_packet(self, link_type: int, timestamp: float | None, packet: memoryview, length: int):
+        self.packets += 1
+        self.bytes += length
+        if timestamp is not None:
+            if self.first_timestamp is None or timestamp < self.first_timestamp:
+                self.first_timestamp = timestamp
+            if self.last_timestamp is None or timestamp > self.last_timestamp:
+                self.last_timestamp = timestamp
+        try:
+            self._on_link(link_type, packet, length)
+        except (struct.error, IndexError, ValueError):
+            # Truncated or malformed packets are only counted
+            pass
+
+    def _on_link(self, link_type: int, packet: memoryview, length: int):
+        if link_type == LINKTYPE_ETHERNET:
+            ethertype, = struct.unpack_from('>H', packet, 12)
+            offset = 14
+            while ethertype in ETHERTYPE_VLAN:
+                ethertype, = struct.unpack_from('>H', packet, offset + 2)
+                offset += 4
+        elif link_type == LINKTYPE_LINUX_SLL:
+            ethertype, = struct.unpack_from('>H', packet, 14)
+            offset = 16
+        elif link_type == LINKTYPE_LINUX_SLL2:
+            ethertype, = struct.unpack_from('>H', packet, 0)
+            offset = 20
+        elif link_type == LINKTYPE_NULL:
+            family = struct.unpack_from('<I', packet, 0)[0]
+            if family > 0xffff:
+                family = struct.unpack_from('>I', packet, 0)[0]
+            ethertype = ETHERTYPE_IPV4 if family == 2 else ETHERTYPE_IPV6
+            offset = 4
+        elif link_type in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            ethertype = ETHERTYPE_IPV4 if packet[0] >> 4 == 4 else ETHERTYPE_IPV6
+            offset = 0
+        else:
+            return
+        if ethertype == ETHERTYPE_IPV4:
+            self._on_ipv4(packet[offset:], length)
+        elif ethertype == ETHERTYPE_IPV6:
+            self._on_ipv6(packet[offset:], length)
+
+    def _on_ipv4(self, packet: memoryview, length: int):
+        header_length = (packet[0] & 0x0f) * 4
+        fragment, = struct.unpack_from('>H', packet, 6)
+        protocol = packet[9]
+        source = str(ipaddress.IPv4Address(bytes(packet[12:16])))
+        destination = str(ipaddress.IPv4Address(bytes(packet[16:20])))
+        # Only the first fragment has the transport header
+        payload = packet[header_length:] if fragment & 0x1fff == 0 else None
+        self._on_ip(protocol, source, destination, payload, length)
+
+    def _on_ipv6(self, packet: memoryview, length: int):
+        protocol = packet[6]
+        source = str(ipaddress.IPv6Address(bytes(packet[8:24])))
+        destination = str(ipaddress.IPv6Address(bytes(packet[24:40])))
+        offset = 40
+        while protocol in IPV6_EXTENSION_HEADERS:
+            protocol = packet[offset]
+            offset += (packet[offset + 1] + 1) * 8
+        payload = packet[offset:] if protocol != 44 else None
+        self._on_ip(protocol, source, destination, payload, length)
+
+    def _on_ip(self, protocol: int, source: str, destination: str, payload: memoryview | None, length: int):
+        name = PROTOCOLS.get(protocol, str(protocol))
+        self.protocols[name] = self.protocols.get(name, 0) + 1
+        for host in (source, destination):
+            if host in self.hosts:
+                self.hosts[host] += length
+            elif len(self.hosts) < self.max_hosts:
+                self.hosts[host] = length
+        source_port = destination_port = 0
+        if payload is not None and protocol in (6, 17) and len(payload) >= 8:
+            source_port, destination_port = struct.unpack_from('>HH', payload)
+            if protocol == 17 and 53 in (source_port, destination_port):
+                self._on_dns(payload[8:])
+            elif protocol == 6 and len(payload) >= 20:
+                data = payload[(payload[12] >> 4) * 4:]
+                if len(data) > 5 and data[0] == 0x16 and data[5] == 0x01:
+                    self._on_client_hello(data)
+        # Both directions of a connection are the same flow
+        a, b = (source, source_port), (destination, destination_port)
+        key = (name, a, b) if a <= b else (name, b, a)
+        flow = self.flows.get(key)
+        if flow:
+            flow[0] += 1
+            flow[1] += length
+        elif len(self.flows) < self.max_flows:
+            self.flows[key] = [1, length]
+
+    def _count_name(self, names: dict[str, int], name: str):
+        if name in names:
+            names[name] += 1
+        elif len(names) < self.max_names:
+            names[name] = 1
+
+    def _on_dns(self, message: memoryview):
+        if len(message) < 12 or struct.unpack_from('>H', message, 4)[0] == 0:
+            return
+        labels = []
+        offset = 12
+        while message[offset]:
+            size = message[offset]
+            if size & 0xc0:
+                return
+            labels.append(bytes(message[offset + 1:offset + 1 + size]).decode('ascii', errors='replace'))
+            offset += 1 + size
+        if labels:
+            self._count_name(self.dns_names, '.'.join(labels).lower())
+
+    def _on_client_hello(self, record: memoryview):
+        # TLS record header (5), handshake header (4), version (2), random (32)
+        offset = 5 + 4 + 2 + 32
+        offset += 1 + record[offset]
+        offset += 2 + struct.unpack_from('>H', record, offset)[0]
+        offset += 1 + record[offset]
+        end = offset + 2 + struct.unpack_from('>H', record, offset)[0]
+        offset += 2
+        while offset + 4 <= min(end, len(record)):
+            extension, size = struct.unpack_from('>HH', record, offset)
+            if extension == 0:
+                # Server name list: list length (2), name type (1), name length (2), name
+                name_length, = struct.unpack_from('>H', record, offset + 7)
+                name = bytes(record[offset + 9:offset + 9 + name_length]).decode('ascii', errors='replace')
+                self._count_name(self.sni_names, name.lower())
+                return
+            offset += 4 + size
+
+    # Results
+
+    @staticmethod
+    def _format_time(timestamp: float | None) -> str:
+        if timestamp is None:
+            return ''
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+    @staticmethod
+    def _top(counts: dict, limit: int) -> list:
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def to_attributes(self) -> dict[str, str]:
+        # Colander stores the attributes of an artifact as strings
+        flows = []
+        for (protocol, a, b), (packets, size) in self._top(self.flows, self.top):
+            flows.append(f'{protocol} {a[0]}:{a[1]} <-> {b[0]}:{b[1]} ({packets} packets, {size} bytes)')
+        duration = (self.last_timestamp - self.first_timestamp) if self.first_timestamp is not None else 0
+        return {
+            'pcap_packets': str(self.packets),
+            'pcap_bytes': str(self.bytes),
+            'pcap_first_packet': self._format_time(self.first_timestamp),
+            'pcap_last_packet': self._format_time(self.last_timestamp),
+            'pcap_duration': f'{duration:.3f}',
+            'pcap_flows': str(len(self.flows)),
+            'pcap_protocols': ', '.join(f'{p} ({n})' for p, n in self._top(self.protocols, self.top)),
+            'pcap_top_flows': '\n'.join(flows),
+            'pcap_top_talkers': '\n'.join(f'{h} ({n} bytes)' for h, n in self._top(self.hosts, self.top)),
+            'pcap_dns_names': ', '.join(sorted(self.dns_names)),
+            'pcap_sni_names': ', '.join(sorted(self.sni_names)),
+        }
+
+
+def summarize_pcap(path: Path) -> dict[str, str]:
+    summary = PcapSummary()
+    with open(path, mode='rb') as f:
+        while data := f.read(READ_SIZE):
+            summary.feed(data)
+    return summary.to_attributes()
@@ -0,0 +1,127 @@
+import json
+import re
+from pathlib import Path
+
+READ_SIZE = 1024 * 1024
+# Content written for the missing files by the previous versions of the connector
+PLACEHOLDERS = (b'', b'[]', b'{}')
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# The rest of a number cut at the end of the buffer, such as the exponent of 1.5e10
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class JsonStreamValidator:
+    # The top-level array or object is decoded one element at a time, only the element being
+    # decoded is kept in memory however large the file is
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.offset = 0
+        self.eof = False
+        self.items = 0
+
+    def _error(self, msg: str) -> ValueError:
+        return ValueError(f'{msg} at character {self.offset + self.position}')
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        # Read at least as much as already buffered so that a large element is decoded a few times only
+        data = self.f.read(max(READ_SIZE, len(self.buffer) - self.position))
+        if not data:
+            self.eof = True
+            return False
+        self.offset += self.position
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+        return True
+
+    def _next_char(self) -> str:
+        # Next non-whitespace character, empty at the end of the file
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ''
+
+    def _expect(self, expected: str) -> str:
+        c = self._next_char()
+        if not c or c not in expected:
+            raise self._error(f'Expecting {" or ".join(repr(e) for e in expected)}')
+        self.position += 1
+        return c
+
+    def _decode_value(self):
+        while True:
+            try:
+                _, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as e:
+                # Only an element cut at the end of the buffer may be completed by the next chunk
+                truncated = e.pos >= len(self.buffer) - 8 or e.msg.startswith('Unterminated string')
+                if truncated and self._fill():
+                    continue
+                raise ValueError(f'{e.msg} at character {self.offset + e.pos}')
+            # A number may continue in the next chunk
+            if self.buffer[self.position] in '-0123456789' and NUMBER_TAIL.match(self.buffer, end) and self._fill():
+                continue
+            self.position = end
+            return
+
+    def _decode_elements(self, closing: str, is_object: bool):
+        if self._next_char() == closing:
+            self.position += 1
+            return
+        while True:
+            if is_object:
+                if self._next_char() != '"':
+                    raise self._error('Expecting property name enclosed in double quotes')
+                self._decode_value()
+                self._expect(':')
+            self._next_char()
+            self._decode_value()
+            self.items += 1
+            if self._expect(',' + closing) == closing:
+                return
+
+    def validate(self) -> int:
+        c = self._next_char()
+        if c == '[':
+            self.position += 1
+            self._decode_elements(']', is_object=False)
+        elif c == '{':
+            self.position += 1
+            self._decode_elements('}', is_object=True)
+        elif c:
+            self._decode_value()
+            self.items = 1
+        if self._next_char():
+            raise self._error('Extra data')
+        return self.items
+
+
+def validate_json_file(path: Path) -> int:
+    # Number of elements of the top-level array or object, raises ValueError if the file is not valid JSON
+    with open(path, encoding='utf-8') as f:
+        try:
+            return JsonStreamValidator(f).validate()
+        except UnicodeDecodeError as e:
+            raise ValueError(f'Invalid UTF-8: {e.reason}')
+
+
+def is_empty_file(path: Path) -> bool:
+    # Empty, blank or a placeholder, only small files are read
+    if path.stat().st_size > 64:
+        return False
+    return path.read_bytes().strip() in PLACEHOLDERS
+
+
+def check_file(path: Path) -> bool:
+    # False if the file has nothing worth uploading, raises ValueError if it is not valid
+    if is_empty_file(path):
+        return False
+    if path.suffix.lower() == '.json':
+        return validate_json_file(path) > 0
+    return True
@@ -0,0 +1,152 @@
+import itertools
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+log = logging.getLogger(__name__)
+
+# Small and metadata rich artifacts are uploaded first, large captures and screencasts last
+PRIORITY_CLASSES = {
+    'DEVICE': 0,
+    'SSLKEYLOG': 0,
+    'SOCKET_T': 1,
+    'CRYPTO_T': 1,
+    'PCAP': 3,
+    'VIDEO': 4,
+}
+DEFAULT_PRIORITY_CLASS = 2
+
+DEFAULT_JOBS = 4
+
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(rate: str) -> int:
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*', rate, re.IGNORECASE)
+    if not match:
+        raise ValueError(f'Invalid rate {rate}, expected a number of bytes per second such as 512K or 2M')
+    return int(float(match.group(1)) * RATE_UNITS[match.group(2).upper()])
+
+
+def artifact_priority(artifact_type_name: str | None, size: int) -> tuple[int, int]:
+    return PRIORITY_CLASSES.get(artifact_type_name, DEFAULT_PRIORITY_CLASS), size
+
+
+class RateLimiter:
+    def __init__(self, rate: int, burst: int = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: int):
+        # Token bucket shared by all the uploads, the tokens may go negative for chunks larger than
+        # the burst which makes the next senders wait accordingly
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._timestamp) * self.rate)
+            self._timestamp = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class UploadScheduler:
+    # Latency above the best observed one by this factor means the link is congested
+    congestion_factor = 2.0
+    adjust_interval = 5.0
+    smoothing = 0.3
+
+    def __init__(self, max_workers: int = DEFAULT_JOBS, rate_limit: int = 0, adaptive: bool = True):
+        if max_workers < 1:
+            raise Exception(f'The number of parallel uploads must be at least 1, got {max_workers}')
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.adaptive = adaptive
+        self.concurrency = max_workers
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._active = 0
+        self._latency = None
+        self._best_latency = None
+        self._last_adjustment = time.monotonic()
+        self._shutdown = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f'colander-upload-{i}', daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, *args, priority=(DEFAULT_PRIORITY_CLASS, 0), **kwargs) -> Future:
+        future = Future()
+        self._queue.put((priority, next(self._sequence), future, fn, args, kwargs))
+        return future
+
+    def _work(self):
+        while True:
+            _, _, future, fn, args, kwargs = self._queue.get()
+            if future is None:
+                return
+            with self._condition:
+                # Wait for a slot when the concurrency has been reduced
+                self._condition.wait_for(lambda: self._active < self.concurrency)
+                self._active += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._active -= 1
+                    self._condition.notify_all()
+
+    def throttle(self, amount: int):
+        if self.rate_limiter:
+            self.rate_limiter.acquire(amount)
+
+    def report(self, amount: int, elapsed: float):
+        # Called after each chunk sent to adapt the number of simultaneous uploads (AIMD)
+        if not self.adaptive or amount <= 0:
+            return
+        latency = elapsed / amount
+        with self._condition:
+            self._latency = latency if self._latency is None else \
+                self.smoothing * latency + (1 - self.smoothing) * self._latency
+            if self._best_latency is None or self._latency < self._best_latency:
+                self._best_latency = self._latency
+            now = time.monotonic()
+            if now - self._last_adjustment < self.adjust_interval:
+                return
+            self._last_adjustment = now
+            if self._latency > self.congestion_factor * self._best_latency and self.concurrency > 1:
+                self.concurrency = max(1, self.concurrency // 2)
+                log.info(f'The upload latency increases, reducing to {self.concurrency} simultaneous uploads')
+            elif self._latency < 1.2 * self._best_latency and self.concurrency < self.max_workers:
+                self.concurrency += 1
+                self._condition.notify_all()
+
+    def shutdown(self, wait: bool = True):
+        if self._shutdown:
+            return
+        self._shutdown = True
+        for _ in self._workers:
+            # Sentinels are queued after any pending upload
+            self._queue.put(((float('inf'),), next(self._sequence), None, None, None, None))
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown(wait=True)
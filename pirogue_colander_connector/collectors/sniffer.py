@@ -0,0 +1,79 @@
+import re
+import zipfile
+from pathlib import Path
+
+# Only the beginning of the files is read, enough for the magic bytes and the first records
+SNIFF_SIZE = 8 * 1024
+
+PCAP_MAGICS = (
+    b'\xa1\xb2\xc3\xd4', b'\xd4\xc3\xb2\xa1',  # microseconds
+    b'\xa1\xb2\x3c\x4d', b'\x4d\x3c\xb2\xa1',  # nanoseconds
+    b'\x0a\x0d\x0d\x0a',  # pcapng section header block
+)
+IMAGE_MAGICS = (
+    b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'II*\x00', b'MM\x00*',
+)
+DOCUMENT_MAGICS = (
+    b'%PDF-',
+    b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',  # Legacy Microsoft Office
+    b'{\\rtf',
+)
+IMAGE_BRANDS = (b'heic', b'heix', b'mif1', b'msf1', b'avif')
+SSLKEYLOG_LABELS = (
+    b'CLIENT_RANDOM ', b'RSA ', b'CLIENT_EARLY_TRAFFIC_SECRET ', b'CLIENT_HANDSHAKE_TRAFFIC_SECRET ',
+    b'SERVER_HANDSHAKE_TRAFFIC_SECRET ', b'CLIENT_TRAFFIC_SECRET_0 ', b'SERVER_TRAFFIC_SECRET_0 ',
+    b'EARLY_EXPORTER_SECRET ', b'EXPORTER_SECRET ',
+)
+# Keys of the records written by pirogue-intercept
+CRYPTO_TRACE_KEYS = re.compile(rb'"(alg|algorithm|cipher|iv|key)"\s*:')
+SOCKET_TRACE_KEYS = re.compile(rb'"(socket_event_type|socket_type|dst_addr|dst_port|local_port|remote_port)"\s*:')
+ANDROID_ENTRIES = ('AndroidManifest.xml', 'classes.dex')
+
+
+def _sniff_zip(path: Path, head: bytes) -> str:
+    # The names of the first entries are in the local file headers, the central directory at the
+    # end of the file tells the rest without decompressing anything
+    if any(name.encode() in head for name in ANDROID_ENTRIES) or b'.apk' in head:
+        return 'SAMPLE'
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return 'OTHER'
+    # APK, or XAPK bundling the APKs of the application
+    if any(n in ANDROID_ENTRIES or n.endswith('.apk') for n in names):
+        return 'SAMPLE'
+    return 'OTHER'
+
+
+def _sniff_text(head: bytes) -> str:
+    text = head.lstrip()
+    # Key log files may start with comments
+    if text.startswith(SSLKEYLOG_LABELS) or (
+            text.startswith(b'#') and any(b'\n' + label in text for label in SSLKEYLOG_LABELS)):
+        return 'SSLKEYLOG'
+    if text[:1] in (b'[', b'{'):
+        if SOCKET_TRACE_KEYS.search(text):
+            return 'SOCKET_T'
+        if CRYPTO_TRACE_KEYS.search(text):
+            return 'CRYPTO_T'
+    return ''
+
+
+def sniff_artifact_type(path: Path) -> str:
+    # Colander short name of the artifact type, an empty string if unknown
+    with open(path, mode='rb') as f:
+        head = f.read(SNIFF_SIZE)
+    if head.startswith(PCAP_MAGICS):
+        return 'PCAP'
+    if head.startswith(b'PK\x03\x04'):
+        return _sniff_zip(path, head)
+    if head.startswith(DOCUMENT_MAGICS):
+        return 'DOCUMENT'
+    if head.startswith(IMAGE_MAGICS) or head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'IMAGE'
+    if head[4:8] == b'ftyp':
+        return 'IMAGE' if head[8:12] in IMAGE_BRANDS else 'VIDEO'
+    if head.startswith(b'\x1a\x45\xdf\xa3') or head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return 'VIDEO'
+    return _sniff_text(head)
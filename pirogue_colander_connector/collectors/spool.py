@@ -0,0 +1,238 @@
+import fcntl
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from requests.exceptions import ConnectionError, Timeout
+
+from pirogue_colander_connector.collectors.artifact import ArtifactCollector
+from pirogue_colander_connector.collectors.experiment import ExperimentCollector
+from pirogue_colander_connector.collectors.folder import walk_folder
+from pirogue_colander_connector.collectors.ignore import ColanderIgnoreFile
+from pirogue_colander_connector.collectors.scheduler import DEFAULT_JOBS, UploadScheduler
+from pirogue_colander_connector.commands.configure import Configuration
+
+log = logging.getLogger(__name__)
+
+ARTIFACT_JOB = 'artifact'
+EXPERIMENT_JOB = 'experiment'
+
+
+class UploadSpool:
+    max_attempts = 5
+
+    def __init__(self, spool_path: str):
+        self.spool_path = spool_path
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._connection = sqlite3.connect(spool_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, '
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                'last_error TEXT, result TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+
+    def add(self, kind: str, payload: dict) -> int:
+        now = time.time()
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO jobs (kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                (kind, json.dumps(payload), now, now)
+            )
+        return cursor.lastrowid
+
+    def acquire(self) -> bool:
+        # Only one flush at a time so that a job cannot be uploaded twice
+        self._lock_file = open(f'{self.spool_path}.lock', mode='w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+        with self._lock, self._connection:
+            # Jobs left running by an interrupted flush, the index and the checkpoints make them resume
+            self._connection.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+        return True
+
+    def release(self):
+        if self._lock_file:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def next_job(self, after: int = 0) -> tuple[int, str, dict, int] | None:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT id, kind, payload, attempts FROM jobs WHERE status = 'pending' AND id > ? ORDER BY id LIMIT 1",
+                (after,)
+            ).fetchone()
+            if not row:
+                return None
+            self._set_status(row[0], 'running')
+        return row[0], row[1], json.loads(row[2]), row[3]
+
+    def _set_status(self, job_id: int, status: str, **columns):
+        assignments = ''.join(f', {column} = ?' for column in columns)
+        self._connection.execute(
+            f'UPDATE jobs SET status = ?, updated_at = ?{assignments} WHERE id = ?',
+            (status, time.time(), *columns.values(), job_id)
+        )
+
+    def complete(self, job_id: int, result: dict):
+        with self._lock, self._connection:
+            self._set_status(job_id, 'done', result=json.dumps(result, default=str))
+
+    def fail(self, job_id: int, attempts: int, error: Exception):
+        status = 'failed' if attempts >= self.max_attempts else 'pending'
+        with self._lock, self._connection:
+            self._set_status(job_id, status, attempts=attempts, last_error=str(error))
+
+    def postpone(self, job_id: int):
+        with self._lock, self._connection:
+            self._set_status(job_id, 'pending')
+
+    def retry_failed(self) -> int:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0 WHERE status = 'failed'")
+        return cursor.rowcount
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return dict(rows)
+
+    def close(self):
+        self.release()
+        self._connection.close()
+
+
+def is_colander_reachable() -> bool:
+    # The client is shared by the whole process, it has to contact the server again
+    try:
+        Configuration().get_colander_client().ping()
+        return True
+    except (ConnectionError, Timeout) as e:
+        log.warning(f'Colander is not reachable: {e}')
+        return False
+
+
+def spool_artifacts(spool: UploadSpool, path: Path, case_id: str, force: bool = False,
+                    recursive: bool = False, pcap_summary: bool = False, compress: bool = False,
+                    artifact_type_name: str = None, attributes: dict = None, files: list[Path] = None) -> list[int]:
+    # Only the given files of the folder when some of them have already been uploaded
+    path = path.absolute()
+    if files:
+        files = [f.absolute() for f in files]
+    elif path.is_file():
+        files = [path]
+    elif path.is_dir():
+        files = sorted(Path(entry.path) for entry in walk_folder(path, ColanderIgnoreFile(path), recursive))
+    else:
+        msg = f'{path} does not exist'
+        log.error(msg)
+        raise Exception(msg)
+    job_ids = [
+        spool.add(ARTIFACT_JOB, {
+            'path': str(f), 'case_id': case_id, 'artifact_type': artifact_type_name, 'attributes': attributes,
+            'force': force, 'pcap_summary': pcap_summary, 'compress': compress
+        })
+        for f in files
+    ]
+    log.info(f'{len(job_ids)} file(s) added to the spool, run the flush command to upload them')
+    return job_ids
+
+
+def spool_experiment(spool: UploadSpool, path: Path, case_id: str, experiment_name: str,
+                     target_artifact_path: Path = None, force: bool = False, pcap_summary: bool = False) -> int:
+    path = path.absolute()
+    if not (path / 'experiment.json').is_file():
+        msg = f'{path}/experiment.json not found'
+        log.error(msg)
+        raise Exception(msg)
+    job_id = spool.add(EXPERIMENT_JOB, {
+        'path': str(path),
+        'case_id': case_id,
+        'name': experiment_name,
+        'target_artifact': str(target_artifact_path.absolute()) if target_artifact_path else None,
+        'force': force,
+        'pcap_summary': pcap_summary,
+    })
+    log.info(f'The experiment {experiment_name} has been added to the spool, run the flush command to upload it')
+    return job_id
+
+
+class SpoolFlusher:
+    def __init__(self, spool: UploadSpool, jobs: int = DEFAULT_JOBS, rate_limit: int = 0):
+        self.spool = spool
+        self.jobs = jobs
+        self.rate_limit = rate_limit
+
+    def _run(self, kind: str, payload: dict):
+        if kind == ARTIFACT_JOB:
+            with UploadScheduler(max_workers=1, rate_limit=self.rate_limit) as scheduler:
+                collector = ArtifactCollector(Path(payload['path']), payload['case_id'],
+                                              artifact_type_name=payload.get('artifact_type'),
+                                              attributes=payload.get('attributes'),
+                                              force=payload.get('force', False), scheduler=scheduler,
+                                              pcap_summary=payload.get('pcap_summary', False),
+                                              compress=payload.get('compress', False))
+                return collector.collect()
+        elif kind == EXPERIMENT_JOB:
+            target_artifact = payload.get('target_artifact')
+            collector = ExperimentCollector(Path(payload['path']), payload['case_id'], payload['name'],
+                                            target_artifact_path=Path(target_artifact) if target_artifact else None,
+                                            force=payload.get('force', False), jobs=self.jobs,
+                                            rate_limit=self.rate_limit,
+                                            pcap_summary=payload.get('pcap_summary', False))
+            collector.collect()
+            return {'artifacts': collector.artifacts, 'target_device': collector.target_device}
+        raise Exception(f'Unknown job type {kind}')
+
+    def flush(self) -> bool:
+        # Jobs are uploaded in the order they have been spooled, until the server becomes unreachable
+        if not is_colander_reachable():
+            return False
+        job_id = 0
+        # A failed job is retried on the next flush, not right away
+        while job := self.spool.next_job(after=job_id):
+            job_id, kind, payload, attempts = job
+            log.info(f'Uploading the spooled {kind} {payload["path"]} [#{job_id}]')
+            try:
+                result = self._run(kind, payload)
+            except (ConnectionError, Timeout) as e:
+                log.warning(f'Colander is not reachable anymore, the upload will be resumed later: {e}')
+                self.spool.postpone(job_id)
+                return False
+            except Exception as e:
+                log.error(f'Failed to upload the spooled {kind} {payload["path"]} [#{job_id}]: {e}')
+                self.spool.fail(job_id, attempts + 1, e)
+                continue
+            self.spool.complete(job_id, result)
+        return True
+
+    def run(self, daemon: bool = False, interval: float = 60):
+        if not self.spool.acquire():
+            msg = 'The spool is already being flushed by another process'
+            log.error(msg)
+            raise Exception(msg)
+        try:
+            while True:
+                flushed = self.flush()
+                counts = self.spool.counts()
+                log.info(f'{counts.get("pending", 0)} job(s) pending, {counts.get("failed", 0)} failed')
+                if not daemon:
+                    if not flushed:
+                        msg = 'Unable to flush the spool, Colander is not reachable'
+                        log.error(msg)
+                        raise Exception(msg)
+                    return counts
+                time.sleep(interval)
+        finally:
+            self.spool.release()
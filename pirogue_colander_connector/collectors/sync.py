@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class SyncManifest:
+    # Files of the synchronized folders already uploaded to a case, with their size and modification
+    # time when they were uploaded. A file whose size and modification time have not changed since
+    # is not even read.
+    commit_every = 100
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._connection = sqlite3.connect(manifest_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'folder TEXT NOT NULL, case_id TEXT NOT NULL, path TEXT NOT NULL, '
+                'size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, artifact_id TEXT NOT NULL, '
+                'PRIMARY KEY (folder, case_id, path))'
+            )
+
+    def load(self, folder: Path, case_id: str) -> dict[str, tuple[int, int]]:
+        # The whole manifest of the folder is loaded once, rather than a query per file of the folder
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT path, size, mtime_ns FROM files WHERE folder = ? AND case_id = ?',
+                (str(folder), str(case_id))
+            ).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    @staticmethod
+    def is_unchanged(entry: tuple[int, int] | None, stat: os.stat_result) -> bool:
+        return entry is not None and entry == (stat.st_size, stat.st_mtime_ns)
+
+    def record(self, folder: Path, case_id: str, path: str, stat: os.stat_result, artifact_id: str):
+        # Committed by batches, a few thousand commits would take longer than the scan of the folder
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO files (folder, case_id, path, size, mtime_ns, artifact_id) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (str(folder), str(case_id), path, stat.st_size, stat.st_mtime_ns, str(artifact_id))
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._connection.commit()
+                self._pending = 0
+
+    def prune(self, folder: Path, case_id: str, paths: set[str]) -> int:
+        # Forget the files which are not in the folder anymore, their artifacts are kept in Colander
+        with self._lock, self._connection:
+            gone = [
+                (str(folder), str(case_id), path)
+                for path, in self._connection.execute(
+                    'SELECT path FROM files WHERE folder = ? AND case_id = ?', (str(folder), str(case_id)))
+                if path not in paths
+            ]
+            self._connection.executemany('DELETE FROM files WHERE folder = ? AND case_id = ? AND path = ?', gone)
+        return len(gone)
+
+    def commit(self):
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            self._connection.close()
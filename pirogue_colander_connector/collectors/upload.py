@@ -0,0 +1,170 @@
+import io
+import logging
+import time
+from pathlib import Path
+from typing import Iterator
+
+from coreapi.exceptions import ErrorMessage
+from coreapi.utils import File
+
+from pirogue_colander_connector.collectors.client import ColanderClient
+from pirogue_colander_connector.collectors.events import UPLOAD, events
+from pirogue_colander_connector.collectors.compression import EXTENSIONS, hash_compressed_file, iter_compressed_chunks
+from pirogue_colander_connector.collectors.index import ArtifactIndex, HASH_CHUNK_SIZE, hash_file, read_chunks
+from pirogue_colander_connector.collectors.metrics import metrics
+from pirogue_colander_connector.collectors.scheduler import UploadScheduler
+
+log = logging.getLogger(__name__)
+
+
+class ResumableUpload:
+    chunk_size = HASH_CHUNK_SIZE
+
+    def __init__(self, colander_client: ColanderClient, file_path: Path, index: ArtifactIndex,
+                 digest: tuple[str, int, dict[int, str]] = None, scheduler: UploadScheduler = None,
+                 compression: str = None):
+        self.colander_client = colander_client
+        self.scheduler = scheduler
+        self.file_path = file_path
+        self.index = index
+        # The compressed content is sent, the digest must be the one of the compressed content
+        self.compression = compression
+        self.name = file_path.name + EXTENSIONS[compression] if compression else file_path.name
+        if not digest and compression:
+            with metrics.phase('compression'):
+                digest = hash_compressed_file(file_path, compression)
+        elif not digest:
+            with metrics.phase('hashing'):
+                digest = hash_file(file_path)
+        self.sha256, self.size, self.chunks = digest
+        self.upload_request_id = None
+        self.resumed = False
+        self.bytes_sent = 0
+        # Only one upload of the process at a time uses the checkpoint of a given content
+        self.checkpoint_key = ('checkpoint', self.sha256, self.size)
+        self.owns_checkpoint = None
+
+    def _create_upload_request(self) -> str:
+        with metrics.phase('upload_initiation'):
+            upload_request = self.colander_client._action(['upload_requests', 'create'], params={
+                'name': self.name,
+                'size': self.size,
+                'chunks': self.chunks,
+            })
+        self._save_checkpoint(upload_request['id'], 0)
+        return upload_request['id']
+
+    def _save_checkpoint(self, upload_request_id: str, addr: int):
+        if self.owns_checkpoint:
+            self.index.save_checkpoint(self.sha256, self.size, upload_request_id, addr)
+
+    def _send_chunk(self, addr: int, buf: bytes):
+        # Resending a chunk is harmless since Colander stores it at the given address
+        return self.colander_client._action(
+            ['upload_requests', 'partial_update'],
+            params={
+                'id': self.upload_request_id,
+                'file': File(f'{addr}.{self.name}', io.BytesIO(buf)),
+                'addr': addr,
+            },
+            encoding='multipart/form-data',
+            idempotent=True,
+        )
+
+    def _read_chunks(self, addr: int) -> Iterator[bytes]:
+        if not self.compression:
+            yield from read_chunks(self.file_path, addr)
+            return
+        # The compressed content cannot be seeked, the chunks already sent are compressed again and skipped
+        offset = 0
+        for chunk in iter_compressed_chunks(self.file_path, self.compression, self.chunk_size):
+            if offset >= addr:
+                yield chunk
+            offset += len(chunk)
+
+    def _publish(self, status: str, sent: int):
+        events.publish(UPLOAD, self.file_path, status, sent=sent, size=self.size)
+
+    def transfer(self) -> str:
+        if self.owns_checkpoint is None:
+            self.owns_checkpoint = self.index.claim(self.checkpoint_key) is None
+            if not self.owns_checkpoint:
+                # The same content is being uploaded by another collector, it gets its own upload request
+                log.info(f'The same content as {self.file_path} is being uploaded, it is not resumable')
+        addr = 0
+        checkpoint = self.index.get_checkpoint(self.sha256, self.size) if self.owns_checkpoint else None
+        self.resumed = bool(checkpoint)
+        if checkpoint:
+            self.upload_request_id, addr = checkpoint
+            if addr < self.size:
+                log.info(f'Resuming the upload of {self.file_path} at {addr}/{self.size} bytes')
+            self._publish('resuming', addr)
+        else:
+            self.upload_request_id = self._create_upload_request()
+            self._publish('initiated', 0)
+
+        last_response = None
+        for buf in self._read_chunks(addr):
+            try:
+                if self.scheduler:
+                    self.scheduler.throttle(len(buf))
+                start = time.monotonic()
+                with metrics.phase('transfer'):
+                    last_response = self._send_chunk(addr, buf)
+                if self.scheduler:
+                    self.scheduler.report(len(buf), time.monotonic() - start)
+            except ErrorMessage:
+                if not checkpoint:
+                    raise
+                # The upload request may have expired on the server, start over
+                log.warning(f'Unable to resume the upload of {self.file_path}, starting over')
+                self.index.discard_checkpoint(self.sha256, self.size)
+                return self.transfer()
+            checkpoint = None
+            addr += len(buf)
+            self.bytes_sent += len(buf)
+            metrics.increment('bytes_sent', len(buf))
+            metrics.increment('chunks_sent')
+            self._save_checkpoint(self.upload_request_id, addr)
+            self._publish('uploading', addr)
+
+        # A transfer resumed after its last chunk has nothing left to send
+        if last_response is not None and (not last_response['eof'] or not last_response['status'] == 'SUCCEEDED'):
+            self._publish('failed', addr)
+            raise Exception(f'The upload of {self.file_path} failed')
+        self._publish('complete', addr)
+        return self.upload_request_id
+
+    def create_artifact(self, case: dict, artifact_type: dict, extra_params: dict = None) -> dict:
+        try:
+            return self._create_artifact(case, artifact_type, extra_params)
+        except ErrorMessage:
+            if not self.resumed:
+                raise
+        # The resumed upload request may have expired, or already been used by an artifact whose
+        # creation timed out, in which case the checkpoint would make every run fail
+        log.warning(f'Unable to create the artifact of {self.file_path} from the resumed upload, starting over')
+        self.index.discard_checkpoint(self.sha256, self.size)
+        self.transfer()
+        return self._create_artifact(case, artifact_type, extra_params)
+
+    def _create_artifact(self, case: dict, artifact_type: dict, extra_params: dict = None) -> dict:
+        with metrics.phase('artifact_creation'):
+            artifact = self.colander_client._action(
+                ['artifacts', 'create'],
+                params={
+                    'case': case['id'],
+                    'type': artifact_type['id'],
+                    'upload_request_ref': self.upload_request_id,
+                    **(extra_params or {}),
+                }
+            )
+        if self.owns_checkpoint:
+            self.index.discard_checkpoint(self.sha256, self.size)
+        return artifact
+
+    def release(self):
+        # The checkpoint is kept in the index so that another run can resume the upload
+        if self.owns_checkpoint:
+            self.index.release(self.checkpoint_key)
+            self.owns_checkpoint = None
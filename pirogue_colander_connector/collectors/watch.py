@@ -0,0 +1,181 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from concurrent.futures import Future, wait
+from pathlib import Path
+from typing import Iterator
+
+from pirogue_colander_connector.collectors.experiment import ExperimentCollector
+from pirogue_colander_connector.collectors.ignore import ColanderIgnoreFile
+from pirogue_colander_connector.collectors.scheduler import UploadScheduler, artifact_priority
+from pirogue_colander_connector.collectors.upload import ResumableUpload
+from pirogue_colander_connector.commands.configure import Configuration
+
+log = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise Exception('inotify is not supported on this system')
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f'inotify_init1 failed: {os.strerror(errno)}')
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f'Unable to watch {path}: {os.strerror(errno)}')
+        return wd
+
+    def read_events(self, timeout: float = None) -> Iterator[tuple[int, str]]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        buffer = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            yield mask, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ExperimentWatcher:
+    experiment_file_name = 'experiment.json'
+    # The capture may open a file again, it is only sent once it has not changed for a while
+    settle_delay = 5
+
+    def __init__(self, experiment_path: Path, case_id: str, experiment_name: str,
+                 target_artifact_path: Path = None, jobs: int = ExperimentCollector.default_jobs,
+                 rate_limit: int = 0):
+        configuration = Configuration()
+        if not configuration.is_valid:
+            msg = f'You Colander configuration is invalid'
+            log.error(msg)
+            raise Exception(msg)
+        if not experiment_path.exists() or not experiment_path.is_dir():
+            msg = f'{experiment_path} is not a directory'
+            log.error(msg)
+            raise Exception(msg)
+        self.experiment_path = experiment_path.absolute()
+        self.case_id = case_id
+        self.experiment_name = experiment_name
+        self.target_artifact_path = target_artifact_path
+        self.jobs = jobs
+        self.rate_limit = rate_limit
+        self.colander_client = configuration.get_colander_client()
+        self.index = configuration.get_artifact_index()
+        self.colander_ignore = ColanderIgnoreFile(self.experiment_path)
+        self.transfers: dict[Future, Path] = {}
+        # Files closed by the capture, with the time and the size and modification time of their last close
+        self.closed: dict[Path, tuple[float, tuple[int, int]]] = {}
+        # Contents sent in advance, with the size and modification time of the file when it was hashed
+        self.sent: list[tuple[Path, tuple[int, int], str, int]] = []
+
+    @staticmethod
+    def _signature(file_path: Path) -> tuple[int, int] | None:
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _transfer(self, file_path: Path, signature: tuple[int, int], scheduler: UploadScheduler):
+        # Only the content is sent while the capture is running, the artifacts are created once
+        # experiment.json tells their types. ExperimentCollector then resumes the completed transfers.
+        if self._signature(file_path) != signature:
+            return
+        log.info(f'Sending {file_path.name} to Colander')
+        upload = ResumableUpload(self.colander_client, file_path, self.index, scheduler=scheduler)
+        self.sent.append((file_path, signature, upload.sha256, upload.size))
+        try:
+            upload.transfer()
+        finally:
+            upload.release()
+
+    def _on_file_closed(self, file_path: Path):
+        if not file_path.is_file() or self.colander_ignore.is_ignored(file_path):
+            return
+        self.closed[file_path] = (time.monotonic(), self._signature(file_path))
+
+    def _send_settled_files(self, scheduler: UploadScheduler):
+        now = time.monotonic()
+        for file_path, (closed_at, signature) in list(self.closed.items()):
+            if now - closed_at < self.settle_delay:
+                continue
+            del self.closed[file_path]
+            # Written again since, it is sent after its next close
+            if signature is None or self._signature(file_path) != signature:
+                continue
+            # Types are not known yet, the smallest files are sent first
+            priority = artifact_priority(None, signature[0])
+            future = scheduler.submit(self._transfer, file_path, signature, scheduler, priority=priority)
+            self.transfers[future] = file_path
+            future.add_done_callback(self._on_transfer_done)
+
+    def _discard_stale_checkpoints(self):
+        # The content sent in advance of a file modified since will never be resumed
+        for file_path, signature, sha256, size in self.sent:
+            if self._signature(file_path) != signature:
+                log.info(f'{file_path.name} has changed since it has been sent, it is sent again with the experiment')
+                self.index.discard_checkpoint(sha256, size)
+
+    def _on_transfer_done(self, future: Future):
+        file_path = self.transfers.get(future)
+        if future.exception():
+            # Not fatal, the file is uploaded again when the experiment is collected
+            log.warning(f'Unable to send {file_path} in advance: {future.exception()}')
+
+    def watch(self):
+        inotify = Inotify()
+        try:
+            inotify.add_watch(self.experiment_path, IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF)
+            with UploadScheduler(max_workers=self.jobs, rate_limit=self.rate_limit) as scheduler:
+                log.info(f'Watching {self.experiment_path}, waiting for the capture to finish')
+                # The capture may still be writing the files created before the watch started, they are
+                # sent with the experiment
+                if any(entry.name != self.experiment_file_name for entry in os.scandir(self.experiment_path)):
+                    log.info('The files already in the directory will be sent once the capture has finished')
+                finished = (self.experiment_path / self.experiment_file_name).is_file()
+                while not finished:
+                    for mask, name in inotify.read_events(timeout=1):
+                        if mask & (IN_DELETE_SELF | IN_IGNORED):
+                            msg = f'{self.experiment_path} has been deleted'
+                            log.error(msg)
+                            raise Exception(msg)
+                        if mask & IN_Q_OVERFLOW:
+                            log.warning('Some file events have been lost, they will be uploaded at the end')
+                        elif name == self.experiment_file_name:
+                            finished = True
+                        elif name:
+                            self._on_file_closed(self.experiment_path / name)
+                    self._send_settled_files(scheduler)
+                log.info('The capture has finished, waiting for the pending transfers')
+                wait(self.transfers)
+        finally:
+            inotify.close()
+            self._discard_stale_checkpoints()
+        collector = ExperimentCollector(self.experiment_path, self.case_id, self.experiment_name,
+                                        target_artifact_path=self.target_artifact_path, jobs=self.jobs,
+                                        rate_limit=self.rate_limit)
+        collector.collect()
@@ -1,21 +1,34 @@
 import json
 import os
 
-from colander_client.client import Client
+from pirogue_colander_connector.collectors.metrics import metrics
 
 
 class Configuration:
     base_url: str
     api_key: str
+    cache_ttl: int = 0
+    connect_timeout: float = 10
+    read_timeout: float = 60
+    max_retries: int = 3
     is_valid: bool = False
     default_configuration_folder = f'{os.path.expanduser("~")}/.config/pirogue/'
     default_configuration_path: str
+    default_cache_path: str
+    default_index_path: str
+    default_spool_path: str
+    default_sync_manifest_path: str
 
     def __init__(self, prefix=''):
         self.default_configuration_folder = f'{prefix}{self.default_configuration_folder}'
         self.default_configuration_path = f'{self.default_configuration_folder}colander-config.json'
+        self.default_cache_path = f'{self.default_configuration_folder}colander-cache.json'
+        self.default_index_path = f'{self.default_configuration_folder}colander-index.sqlite'
+        self.default_spool_path = f'{self.default_configuration_folder}colander-spool.sqlite'
+        self.default_sync_manifest_path = f'{self.default_configuration_folder}colander-sync.sqlite'
         os.makedirs(self.default_configuration_folder, exist_ok=True)
-        self.load_configuration_file()
+        with metrics.phase('configuration'):
+            self.load_configuration_file()
 
     def load_configuration_file(self):
         if os.path.isfile(self.default_configuration_path):
@@ -26,21 +39,58 @@ class Configuration:
             else:
                 self.base_url = config.get('base_url')
                 self.api_key = config.get('api_key')
+                self.cache_ttl = int(config.get('cache_ttl', 0))
+                self.connect_timeout = float(config.get('connect_timeout', Configuration.connect_timeout))
+                self.read_timeout = float(config.get('read_timeout', Configuration.read_timeout))
+                self.max_retries = int(config.get('max_retries', Configuration.max_retries))
                 self.is_valid = True
 
-    def write_configuration_file(self, base_url: str, api_key: str):
+    def write_configuration_file(self, base_url: str, api_key: str, cache_ttl: int = 0,
+                                 connect_timeout: float = connect_timeout, read_timeout: float = read_timeout,
+                                 max_retries: int = max_retries):
         self.base_url = base_url
         self.api_key = api_key
+        self.cache_ttl = cache_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
         self.is_valid = True
         with open(self.default_configuration_path, mode='w') as config_file:
             config = {
                 'base_url': base_url,
                 'api_key': api_key,
+                'cache_ttl': cache_ttl,
+                'connect_timeout': connect_timeout,
+                'read_timeout': read_timeout,
+                'max_retries': max_retries,
             }
             json.dump(config, config_file, indent=2)
 
+    # The Colander client and its dependencies are only imported by the commands talking to Colander
     def get_colander_client(self):
+        from pirogue_colander_connector.collectors.client import get_shared_client
         if self.is_valid:
-            return Client(base_url=self.base_url, api_key=self.api_key)
+            return get_shared_client(self.base_url, self.api_key, connect_timeout=self.connect_timeout,
+                                     read_timeout=self.read_timeout, max_retries=self.max_retries)
         else:
             raise Exception('Unable to correctly configure the Colander client')
+
+    def get_colander_lookup(self):
+        from pirogue_colander_connector.collectors.lookup import ColanderLookup
+        return ColanderLookup(self.get_colander_client(), cache_path=self.default_cache_path, ttl=self.cache_ttl)
+
+    def get_artifact_index(self):
+        from pirogue_colander_connector.collectors.index import ArtifactIndex
+        return ArtifactIndex(self.default_index_path)
+
+    def get_upload_spool(self):
+        from pirogue_colander_connector.collectors.spool import UploadSpool
+        return UploadSpool(self.default_spool_path)
+
+    def get_sync_manifest(self):
+        from pirogue_colander_connector.collectors.sync import SyncManifest
+        return SyncManifest(self.default_sync_manifest_path)
+
+    def clear_cache(self):
+        from pirogue_colander_connector.collectors.lookup import ColanderLookup
+        ColanderLookup.clear_cache(self.default_cache_path)
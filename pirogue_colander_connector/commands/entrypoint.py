@@ -2,23 +2,29 @@ import argparse
 import logging
 import pathlib
 
-from rich.logging import RichHandler
-from rich.prompt import Prompt
-
-from pirogue_colander_connector.collectors.artifact import ArtifactCollector
-from pirogue_colander_connector.collectors.experiment import ExperimentCollector
-from pirogue_colander_connector.collectors.folder import FolderCollector
+from pirogue_colander_connector.collectors.events import RENDERERS, create_renderer, events
+from pirogue_colander_connector.collectors.metrics import metrics
+from pirogue_colander_connector.collectors.scheduler import DEFAULT_JOBS, UploadScheduler, parse_rate
 from pirogue_colander_connector.commands.configure import Configuration
 
 log = logging.getLogger(__name__)
 
+# Only argparse and the standard library are imported until the arguments have been parsed, each
+# command then imports the modules it needs. The CLI is often run by cron jobs and hooks on a Pi.
 
-def main():
+
+def setup_logging(stderr: bool = False):
+    from rich.console import Console
+    from rich.logging import RichHandler
+    # The JSON lines events are written to stdout, the logs must not be mixed with them
     logging.basicConfig(
         level='INFO',
         format='[%(name)s] %(message)s',
-        handlers=[RichHandler(show_path=False, log_time_format='%X')]
+        handlers=[RichHandler(console=Console(stderr=stderr), show_path=False, log_time_format='%X')]
     )
+
+
+def main():
     arg_parser = argparse.ArgumentParser(prog='colander', description='PiRogue Colander connector')
     subparsers = arg_parser.add_subparsers(dest='func')
     # Config
@@ -37,6 +43,34 @@ def main():
         required=True,
         help='Specify your Colander API key'
     )
+    config_group.add_argument(
+        '--cache_ttl',
+        type=int,
+        default=0,
+        help='Specify for how many seconds cases and types fetched from Colander are cached on disk (0 to disable)'
+    )
+    config_group.add_argument(
+        '--connect_timeout',
+        type=float,
+        default=Configuration.connect_timeout,
+        help='Specify how many seconds to wait for the connection to the Colander server'
+    )
+    config_group.add_argument(
+        '--read_timeout',
+        type=float,
+        default=Configuration.read_timeout,
+        help='Specify how many seconds to wait for the responses of the Colander server'
+    )
+    config_group.add_argument(
+        '--max_retries',
+        type=int,
+        default=Configuration.max_retries,
+        help='Specify how many times a request failing with a transient error is sent again'
+    )
+    # Clear cache
+    subparsers.add_parser(
+        'clear-cache',
+        help='Clear the cached cases and types fetched from Colander')
     # Collect artifact
     collect_artifact_group = subparsers.add_parser(
         'collect-artifact',
@@ -52,6 +86,43 @@ def main():
         required=True,
         help='Specify the ID of the case you created in Colander'
     )
+    collect_artifact_group.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help='Specify the number of files uploaded in parallel when collecting a folder'
+    )
+    collect_artifact_group.add_argument(
+        '-l',
+        '--rate_limit',
+        type=parse_rate,
+        default=0,
+        help='Specify the maximum upload bandwidth in bytes per second, such as 512K or 2M (unlimited by default)'
+    )
+    collect_artifact_group.add_argument(
+        '-f',
+        '--force',
+        action='store_true',
+        help='Upload the files even if they have already been uploaded to the case'
+    )
+    collect_artifact_group.add_argument(
+        '-r',
+        '--recursive',
+        action='store_true',
+        help='Also upload the files contained in the sub-folders when collecting a folder'
+    )
+    collect_artifact_group.add_argument(
+        '--sync',
+        action='store_true',
+        help='Only upload the files of the folder added or modified since its last synchronization'
+    )
+    collect_artifact_group.add_argument(
+        '-s',
+        '--spool',
+        action='store_true',
+        help='Add the upload to the spool and return immediately, run the flush command to upload it'
+    )
     # Collect PiRogue experiment
     collect_experiment_group = subparsers.add_parser(
         'collect-experiment',
@@ -72,23 +143,321 @@ def main():
         help='Specify the artifact you executed during this experiment',
         type=pathlib.Path
     )
+    collect_experiment_group.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help='Specify the number of files uploaded in parallel'
+    )
+    collect_experiment_group.add_argument(
+        '-l',
+        '--rate_limit',
+        type=parse_rate,
+        default=0,
+        help='Specify the maximum upload bandwidth in bytes per second, such as 512K or 2M (unlimited by default)'
+    )
+    collect_experiment_group.add_argument(
+        '-f',
+        '--force',
+        action='store_true',
+        help='Upload the files even if they have already been uploaded to the case'
+    )
+    collect_experiment_group.add_argument(
+        '-s',
+        '--spool',
+        action='store_true',
+        help='Add the upload to the spool and return immediately, run the flush command to upload it'
+    )
+    # Collect many PiRogue experiments
+    collect_experiments_group = subparsers.add_parser(
+        'collect-experiments',
+        help='Upload many PiRogue experiments to Colander')
+    collect_experiments_group.add_argument(
+        'path',
+        type=pathlib.Path,
+        help='Specify the directory containing the directories of the experiments, or a JSON lines manifest '
+             'giving the path, name, case and target artifact of each experiment'
+    )
+    collect_experiments_group.add_argument(
+        '-c',
+        '--case_id',
+        required=False,
+        help='Specify the ID of the case you created in Colander, required unless given by the manifest'
+    )
+    collect_experiments_group.add_argument(
+        '-p',
+        '--parallel',
+        type=int,
+        default=2,
+        help='Specify the number of experiments collected in parallel'
+    )
+    collect_experiments_group.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help='Specify the number of files uploaded in parallel'
+    )
+    collect_experiments_group.add_argument(
+        '-l',
+        '--rate_limit',
+        type=parse_rate,
+        default=0,
+        help='Specify the maximum upload bandwidth in bytes per second, such as 512K or 2M (unlimited by default)'
+    )
+    collect_experiments_group.add_argument(
+        '-f',
+        '--force',
+        action='store_true',
+        help='Upload the files even if they have already been uploaded to the case'
+    )
+    collect_experiments_group.add_argument(
+        '--report',
+        required=False,
+        help='Specify the path of the JSON report giving the result of each experiment'
+    )
+    # Watch a running PiRogue experiment
+    watch_group = subparsers.add_parser(
+        'watch',
+        help='Upload the files of a PiRogue experiment while it is running')
+    watch_group.add_argument(
+        'path',
+        type=pathlib.Path)
+    watch_group.add_argument(
+        '-c',
+        '--case_id',
+        required=True,
+        help='Specify the ID of the case you created in Colander'
+    )
+    watch_group.add_argument(
+        '-n',
+        '--name',
+        required=False,
+        help='Specify the name of your experiment'
+    )
+    watch_group.add_argument(
+        '-t',
+        '--target_artifact',
+        required=False,
+        help='Specify the artifact you executed during this experiment',
+        type=pathlib.Path
+    )
+    watch_group.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help='Specify the number of files uploaded in parallel'
+    )
+    watch_group.add_argument(
+        '-l',
+        '--rate_limit',
+        type=parse_rate,
+        default=0,
+        help='Specify the maximum upload bandwidth in bytes per second, such as 512K or 2M (unlimited by default)'
+    )
+    # Upload the spooled artifacts and experiments
+    flush_group = subparsers.add_parser(
+        'flush',
+        help='Upload the artifacts and experiments added to the spool')
+    flush_group.add_argument(
+        '-d',
+        '--daemon',
+        action='store_true',
+        help='Keep running and upload the spooled artifacts and experiments once Colander is reachable'
+    )
+    flush_group.add_argument(
+        '-i',
+        '--interval',
+        type=float,
+        default=60,
+        help='Specify how many seconds to wait between two flushes in daemon mode'
+    )
+    flush_group.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=DEFAULT_JOBS,
+        help='Specify the number of files of an experiment uploaded in parallel'
+    )
+    flush_group.add_argument(
+        '-l',
+        '--rate_limit',
+        type=parse_rate,
+        default=0,
+        help='Specify the maximum upload bandwidth in bytes per second, such as 512K or 2M (unlimited by default)'
+    )
+    flush_group.add_argument(
+        '--retry_failed',
+        action='store_true',
+        help='Also retry the uploads which have failed too many times'
+    )
+    # Rebuild the index of the uploaded artifacts
+    rebuild_index_group = subparsers.add_parser(
+        'rebuild-index',
+        help='Rebuild the local index of the artifacts already uploaded to a case')
+    rebuild_index_group.add_argument(
+        '-c',
+        '--case_id',
+        required=True,
+        help='Specify the ID of the case you created in Colander'
+    )
+
+    for group in (collect_artifact_group, collect_experiment_group, collect_experiments_group):
+        group.add_argument(
+            '--pcap_summary',
+            action='store_true',
+            help='Attach a summary of the captured traffic (flows, hosts, DNS and TLS server names) to the PCAP artifacts'
+        )
+    # Not for the experiments, Colander analyses the files of an experiment as they are stored
+    collect_artifact_group.add_argument(
+        '-z',
+        '--compress',
+        action='store_true',
+        help='Compress the traces, SSL key logs and PCAPs while uploading them (zstd if installed, gzip otherwise), '
+             'they are stored compressed in Colander'
+    )
+    for group in (collect_artifact_group, collect_experiment_group, collect_experiments_group, watch_group,
+                  flush_group):
+        group.add_argument(
+            '--progress',
+            choices=RENDERERS,
+            default='rich',
+            help='Specify how the progress is displayed: rich display, JSON lines events on stdout, or nothing'
+        )
+        group.add_argument(
+            '--metrics_out',
+            required=False,
+            help='Specify the path of the JSON report of the upload performance'
+        )
+        group.add_argument(
+            '--metrics_prometheus',
+            required=False,
+            help='Specify the path of the upload performance report in the Prometheus textfile format'
+        )
 
     args = arg_parser.parse_args()
     if not args.func:
         arg_parser.print_help()
         return
 
+    setup_logging(stderr=getattr(args, 'progress', None) == 'jsonl')
     if args.func == 'config':
         config = Configuration()
-        config.write_configuration_file(args.base_url, args.api_key)
-    elif args.func == 'collect-artifact':
-        if args.path.is_file():
-            ac = ArtifactCollector(args.path, args.case_id)
-            ac.collect()
-        elif args.path.is_dir():
-            fc = FolderCollector(args.path, args.case_id)
-            fc.collect()
-    elif args.func == 'collect-experiment':
-        experiment_name = Prompt.ask('Enter the name of your experiment')
-        ec = ExperimentCollector(args.path, args.case_id, experiment_name, target_artifact_path=args.target_artifact)
+        config.write_configuration_file(args.base_url, args.api_key, cache_ttl=args.cache_ttl,
+                                        connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+                                        max_retries=args.max_retries)
+        config.clear_cache()
+    elif args.func == 'clear-cache':
+        config = Configuration()
+        config.clear_cache()
+    elif args.func == 'rebuild-index':
+        config = Configuration()
+        index = config.get_artifact_index()
+        index.rebuild(config.get_colander_client(), args.case_id)
+    else:
+        metrics.reset()
+        events.attach(create_renderer(args.progress))
+        try:
+            collect(args)
+        finally:
+            events.detach()
+            write_metrics(args)
+
+
+def collect(args):
+    if args.func == 'collect-experiment':
+        args.experiment_name = ask_experiment_name()
+    if args.func in ('collect-artifact', 'collect-experiment'):
+        from requests.exceptions import ConnectionError, Timeout
+        if args.spool:
+            spool(args)
+            return
+        # Uploads are spooled rather than failing when the PiRogue is offline
+        try:
+            unreachable = upload(args)
+        except (ConnectionError, Timeout) as e:
+            log.warning(f'Colander is not reachable, the upload is added to the spool: {e}')
+            spool(args)
+            return
+        if unreachable:
+            log.warning('Colander is not reachable anymore, the files not uploaded are added to the spool')
+            spool(args, files=unreachable)
+    elif args.func == 'collect-experiments':
+        from pirogue_colander_connector.collectors.batch import BatchExperimentCollector, find_experiments, load_manifest
+        if args.path.is_dir():
+            if not args.case_id:
+                msg = 'The case ID is required when collecting the experiments of a directory'
+                log.error(msg)
+                raise Exception(msg)
+            experiments = find_experiments(args.path, args.case_id)
+        else:
+            experiments = load_manifest(args.path, args.case_id)
+        bc = BatchExperimentCollector(experiments, jobs=args.jobs, parallel=args.parallel, force=args.force,
+                                      rate_limit=args.rate_limit, pcap_summary=args.pcap_summary)
+        bc.collect()
+        if args.report:
+            bc.write_report(args.report)
+    elif args.func == 'watch':
+        from pirogue_colander_connector.collectors.watch import ExperimentWatcher
+        experiment_name = args.name or ask_experiment_name()
+        ew = ExperimentWatcher(args.path, args.case_id, experiment_name, target_artifact_path=args.target_artifact,
+                               jobs=args.jobs, rate_limit=args.rate_limit)
+        ew.watch()
+    elif args.func == 'flush':
+        from pirogue_colander_connector.collectors.spool import SpoolFlusher
+        upload_spool = Configuration().get_upload_spool()
+        if args.retry_failed:
+            upload_spool.retry_failed()
+        flusher = SpoolFlusher(upload_spool, jobs=args.jobs, rate_limit=args.rate_limit)
+        flusher.run(daemon=args.daemon, interval=args.interval)
+
+
+def upload(args) -> list[pathlib.Path]:
+    # Files of a folder which have not been uploaded because Colander is not reachable anymore
+    from requests.exceptions import ConnectionError, Timeout
+    if args.func == 'collect-experiment':
+        from pirogue_colander_connector.collectors.experiment import ExperimentCollector
+        ec = ExperimentCollector(args.path, args.case_id, args.experiment_name,
+                                 target_artifact_path=args.target_artifact, force=args.force, jobs=args.jobs,
+                                 rate_limit=args.rate_limit, pcap_summary=args.pcap_summary)
         ec.collect()
+    elif args.path.is_file():
+        from pirogue_colander_connector.collectors.artifact import ArtifactCollector
+        with UploadScheduler(max_workers=1, rate_limit=args.rate_limit) as scheduler:
+            ac = ArtifactCollector(args.path, args.case_id, force=args.force, scheduler=scheduler,
+                                   pcap_summary=args.pcap_summary, compress=args.compress)
+            ac.collect()
+    elif args.path.is_dir():
+        from pirogue_colander_connector.collectors.folder import FolderCollector
+        fc = FolderCollector(args.path, args.case_id, jobs=args.jobs, force=args.force,
+                             recursive=args.recursive, rate_limit=args.rate_limit, pcap_summary=args.pcap_summary,
+                             compress=args.compress, sync=args.sync)
+        _, failed = fc.collect()
+        return [f for f, e in failed.items() if isinstance(e, (ConnectionError, Timeout))]
+    return []
+
+
+def ask_experiment_name():
+    from rich.prompt import Prompt
+    return Prompt.ask('Enter the name of your experiment')
+
+
+def spool(args, files: list[pathlib.Path] = None):
+    from pirogue_colander_connector.collectors.spool import spool_artifacts, spool_experiment
+    upload_spool = Configuration().get_upload_spool()
+    if args.func == 'collect-artifact':
+        spool_artifacts(upload_spool, args.path, args.case_id, force=args.force, recursive=args.recursive,
+                        pcap_summary=args.pcap_summary, compress=args.compress, files=files)
+    else:
+        spool_experiment(upload_spool, args.path, args.case_id, args.experiment_name,
+                         target_artifact_path=args.target_artifact, force=args.force, pcap_summary=args.pcap_summary)
+
+
+def write_metrics(args):
+    if args.metrics_out:
+        metrics.write_json(args.metrics_out)
+        log.info(f'Upload performance report written to {args.metrics_out}')
+    if args.metrics_prometheus:
+        metrics.write_prometheus(args.metrics_prometheus)
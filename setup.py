@@ -19,6 +19,10 @@ setup(
     long_description_content_type='text/markdown',
     url="https://github.com/PiRogueToolSuite/pirogue-colander-connector",
     install_requires=install_required,
+    extras_require={
+        # Faster and better compression of the uploads than gzip
+        'zstd': ['zstandard'],
+    },
     packages=find_packages(),
     zip_safe=True,
     entry_points={